@@ -0,0 +1,231 @@
+import argparse
+import difflib
+import gc
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inventario import GardenTool, Inventory, JsonStorage, JournalStorage, SQLiteStorage, ToolColumns, reconcile
+
+DEFAULT_SIZES = "1000,10000,100000"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "linea_base.json")
+TOOLS_PER_LOCATION = 50
+AUDIT_LINES = 5000
+LOCATIONS_PER_PHOTO = 4
+WORDS = ["pala", "rastrillo", "azadón", "tijeras", "podar", "manguera", "carretilla", "regadera",
+         "horca", "serrucho", "guantes", "escoba", "cortasetos", "desbrozadora", "plantador", "grande",
+         "pequeña", "metálica", "de", "mango", "largo", "corto", "roja", "verde"]
+ORIENTATIONS = [1, 3, 6, 8]
+
+def tool_name(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).capitalize()
+
+def generate_data(directory, size, seed=0):
+    # Inventario con huecos en la numeración, como el que dejan los borrados
+    rng = random.Random(seed)
+    location_count = max(1, size // TOOLS_PER_LOCATION)
+    locations = [str(i) for i in range(1, location_count + 1)]
+    with open(os.path.join(directory, "inventory.json"), "w") as f:
+        f.write("[")
+        number = 0
+        for i in range(size):
+            number += rng.choice((1, 1, 1, 2))
+            tool = GardenTool(number, tool_name(rng), rng.choice(locations), rng.choice((None,) * 9 + ("Juan",)))
+            f.write(("," if i else "") + json.dumps(tool.to_dict()))
+        f.write("]")
+    with open(os.path.join(directory, "locations.json"), "w") as f:
+        json.dump(locations, f)
+    location_images = {location: f"foto{(int(location) - 1) // LOCATIONS_PER_PHOTO + 1}.jpg" for location in locations}
+    with open(os.path.join(directory, "location_images.json"), "w") as f:
+        json.dump(location_images, f)
+    return rng
+
+def generate_photos(directory, count, size=(4000, 3000), seed=0):
+    # Ruido para que el JPEG cueste decodificarlo como una foto real, con orientaciones EXIF variadas
+    from PIL import Image
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        noise = [Image.effect_noise((size[0] // 4, size[1] // 4), rng.randint(20, 80)) for _ in range(3)]
+        image = Image.merge("RGB", noise).resize(size)
+        exif = image.getexif()
+        exif[274] = ORIENTATIONS[i % len(ORIENTATIONS)]
+        path = os.path.join(directory, f"foto{i + 1}.jpg")
+        image.save(path, "JPEG", quality=90, exif=exif)
+        paths.append(path)
+    return paths
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+def measure(function, repeat, setup=None):
+    # Los tiempos se toman sin tracemalloc; la memoria máxima se mide en una pasada aparte
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        gc.collect()
+        start = time.perf_counter()
+        function(argument) if setup else function()
+        times.append(time.perf_counter() - start)
+    argument = setup() if setup else None
+    gc.collect()
+    tracemalloc.start()
+    function(argument) if setup else function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "p50": percentile(times, 0.5),
+        "p95": percentile(times, 0.95),
+        "max": max(times),
+        "memoria_pico": peak,
+    }
+
+def legacy_next_number(tools):
+    # get_next_available_number original: recorre todo el inventario en cada alta
+    used_numbers = set(tool.number for tool in tools)
+    for i in range(1, len(tools) + 2):
+        if i not in used_numbers:
+            return i
+
+def legacy_similar(tools, search_term):
+    # Búsqueda por similitud original con difflib sobre todos los nombres
+    matches = []
+    for tool in tools:
+        ratio = difflib.SequenceMatcher(None, search_term.lower(), tool.name.lower()).ratio()
+        if ratio > 0.5:
+            matches.append((tool, ratio))
+    return matches
+
+def inventory_cases(size, repeat, rng, difflib_limit):
+    results = {}
+    json_storage = JsonStorage()
+    results["cargar_inventario/json"] = measure(lambda: Inventory(json_storage.load()), repeat)
+    results["cargar_inventario/json_sin_indices"] = measure(json_storage.load, repeat)
+    results["cargar_inventario/columnas"] = measure(lambda: ToolColumns.from_json(json_storage.path), repeat)
+    inventory = Inventory(json_storage.load())
+    for location, image in json_storage.load_location_images().items():
+        inventory.set_location_image(location, image)
+    tools = list(inventory)
+    sample = tools[len(tools) // 2]
+
+    results["guardar_inventario/json"] = measure(lambda: json_storage.record(inventory, [(sample, False)]), repeat)
+
+    journal = JournalStorage(compact_threshold=10 ** 9)
+    journal.load()
+    results["guardar_inventario/diario"] = measure(lambda: journal.record(inventory, [(sample, False)]), repeat)
+    results["cargar_inventario/diario"] = measure(lambda: Inventory(JournalStorage(compact_threshold=10 ** 9).read()), repeat)
+    journal.close()
+
+    database = SQLiteStorage()
+    results["cargar_inventario/sqlite"] = measure(lambda: Inventory(database.load()), repeat)
+    results["guardar_inventario/sqlite"] = measure(lambda: database.record(inventory, [(sample, False)]), repeat)
+    database.close()
+
+    index = inventory.search_index
+    queries = [rng.choice(WORDS)[:rng.randint(3, 6)] for _ in range(repeat)]
+    typos = [word[:-1] + "x" for word in (rng.choice(WORDS) for _ in range(repeat))]
+
+    def without_cache(query):
+        index.results.clear()
+        return query
+    results["buscar/parcial"] = measure(lambda q: index.substring(q), repeat, setup=lambda: without_cache(rng.choice(queries)))
+    results["buscar/numero"] = measure(lambda: inventory.get(sample.number), repeat)
+    results["buscar/trigramas"] = measure(lambda q: index.search(q), repeat, setup=lambda: rng.choice(typos))
+    if size <= difflib_limit:
+        results["buscar/difflib_original"] = measure(lambda q: legacy_similar(tools, q), repeat, setup=lambda: rng.choice(typos))
+
+    def allocate_and_release():
+        number = inventory.numbers.allocate()
+        inventory.numbers.release(number)
+    results["siguiente_numero/asignador"] = measure(allocate_and_release, repeat)
+    results["siguiente_numero/original"] = measure(lambda: legacy_next_number(tools), repeat)
+
+    images = sorted(set(inventory.location_images.values()))
+    results["lista_herramientas/filtrar"] = measure(lambda image: inventory.tools_for_image(image), repeat,
+                                                    setup=lambda: rng.choice(images))
+
+    # Recuento con números, nombres exactos, erratas y líneas que no son del inventario;
+    # tarda segundos con inventarios grandes, así que se mide una sola vez
+    audit = []
+    for tool in rng.sample(tools, min(AUDIT_LINES, len(tools))):
+        kind = rng.random()
+        audit.append(str(tool.number) if kind < 0.2 else tool.name if kind < 0.7
+                     else tool.name[:-1] + "x" if kind < 0.9 else "zzz " + tool.name[:3])
+    results["conciliar/recuento"] = measure(lambda: reconcile(inventory, audit), 1)
+    return results
+
+def image_cases(directory, count, repeat):
+    from main import IMAGE_HEIGHT, THUMBNAIL_BOX, prepare_image
+    paths = generate_photos(directory, count)
+    cycle = itertools.cycle(paths)
+    return {
+        "imagen/vista": measure(lambda path: prepare_image(path, height=IMAGE_HEIGHT), repeat, setup=lambda: next(cycle)),
+        "imagen/miniatura": measure(lambda path: prepare_image(path, box=THUMBNAIL_BOX), repeat, setup=lambda: next(cycle)),
+    }
+
+def print_results(results, baseline):
+    print(f"{'caso':48} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'pico KiB':>10} {'vs base':>9}")
+    for name, result in results.items():
+        change = ""
+        if name in baseline and baseline[name]["p50"] > 0:
+            change = f"{result['p50'] / baseline[name]['p50']:.2f}x"
+        print(f"{name:48} {result['p50'] * 1000:10.3f} {result['p95'] * 1000:10.3f} "
+              f"{result['max'] * 1000:10.3f} {result['memoria_pico'] / 1024:10.0f} {change:>9}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide las operaciones principales con inventarios y fotos sintéticos")
+    parser.add_argument("--tamaños", default=DEFAULT_SIZES, help=f"herramientas por inventario (por defecto {DEFAULT_SIZES})")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--fotos", type=int, default=8, help="fotos generadas para medir la decodificación (0 para omitirlas)")
+    parser.add_argument("--difflib-hasta", type=int, default=100000, help="tamaño máximo en el que se mide la búsqueda con difflib")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--base", default=DEFAULT_BASELINE, help="archivo con la línea base con la que comparar")
+    parser.add_argument("--guardar-base", action="store_true", help="guarda estos resultados como nueva línea base")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.base, "r") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+
+    results = {}
+    start_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="inventario-bench-") as directory:
+        # Los almacenamientos trabajan sobre el directorio actual, como la aplicación
+        os.chdir(directory)
+        try:
+            for size in (int(value) for value in args.tamaños.split(",")):
+                rng = generate_data(directory, size, args.semilla)
+                for name, result in inventory_cases(size, args.repeticiones, rng, args.difflib_hasta).items():
+                    results[f"{size}/{name}"] = result
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+            if args.fotos:
+                results.update(image_cases(directory, args.fotos, args.repeticiones))
+        finally:
+            os.chdir(start_directory)
+
+    print_results(results, baseline)
+    try:
+        import resource
+        # tracemalloc no ve la memoria que reserva PIL en C; el pico del proceso sí la incluye
+        print(f"Pico de memoria del proceso: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    except ImportError:
+        pass
+    if args.guardar_base:
+        with open(args.base, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Línea base guardada en {args.base}")
+
+if __name__ == "__main__":
+    main()
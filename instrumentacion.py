@@ -0,0 +1,136 @@
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SLOW_LOG_FILE = "operaciones_lentas.log"
+TIMINGS_FILE = "tiempos.json"
+SAMPLES_PER_OPERATION = 1000  # Muestras recientes que se guardan para calcular percentiles
+# Fases en las que el programa espera al usuario (diálogos modales): no cuentan como bloqueo
+IDLE_PHASES = {"espera_usuario"}
+
+class Instrumentation:
+    # Mide el tiempo de los manejadores de Tk y de sus fases (E/S, decodificación, lista).
+    # Desactivada no hace nada: wrap() devuelve la función tal cual y phase() no mide.
+    def __init__(self, enabled=False, threshold_ms=100, log_path=SLOW_LOG_FILE, timings_path=TIMINGS_FILE):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.timings_path = timings_path
+        self.samples = {}
+        self.counts = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.logger = logging.getLogger("inventario.lento")
+        if enabled:
+            handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+
+    @classmethod
+    def from_environment(cls):
+        return cls(enabled=os.environ.get("INVENTARIO_INSTRUMENTAR") == "1",
+                   threshold_ms=float(os.environ.get("INVENTARIO_UMBRAL_LENTO_MS", 100)))
+
+    def add(self, name, elapsed_ms):
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=SAMPLES_PER_OPERATION)).append(elapsed_ms)
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed_ms
+
+    def wrap(self, name, function):
+        if not self.enabled:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            previous = getattr(self.local, "phases", None)
+            phases = self.local.phases = {}
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                self.local.phases = previous
+                if previous is not None:
+                    # Llamado desde otro manejador: sus fases también cuentan en el de fuera
+                    for phase, phase_elapsed in phases.items():
+                        previous[phase] = previous.get(phase, 0.0) + phase_elapsed
+                blocking = elapsed - sum(phases.get(phase, 0.0) for phase in IDLE_PHASES)
+                self.add(name, blocking)
+                for phase, phase_elapsed in phases.items():
+                    self.add(f"{name}/{phase}", phase_elapsed)
+                if blocking >= self.threshold_ms:
+                    details = ", ".join(f"{phase}={phase_elapsed:.1f} ms" for phase, phase_elapsed in phases.items())
+                    self.logger.info("%s bloqueó %.1f ms%s", name, blocking, f" ({details})" if details else "")
+        return wrapper
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            phases = getattr(self.local, "phases", None)
+            if phases is not None:
+                phases[name] = phases.get(name, 0.0) + elapsed
+            else:
+                # Fuera de un manejador, por ejemplo en los hilos de precarga
+                self.add(f"fase/{name}", elapsed)
+
+    def wrap_object(self, target, phase):
+        # Devuelve un envoltorio de target en el que cada llamada a un método cuenta como la fase dada
+        if not self.enabled:
+            return target
+        return PhaseProxy(self, target, phase)
+
+    def summary(self):
+        with self.lock:
+            result = {}
+            for name, samples in self.samples.items():
+                ordered = sorted(samples)
+                result[name] = {
+                    "llamadas": self.counts[name],
+                    "total_ms": round(self.totals[name], 3),
+                    "media_ms": round(self.totals[name] / self.counts[name], 3),
+                    "p50_ms": round(ordered[len(ordered) // 2], 3),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                    "max_ms": round(ordered[-1], 3),
+                }
+            return result
+
+    def export(self, path=None):
+        if not self.enabled:
+            return
+        with open(path or self.timings_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+class PhaseProxy:
+    def __init__(self, instrumentation, target, phase):
+        self._instrumentation = instrumentation
+        self._target = target
+        self._phase = phase
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def wrapper(*args, **kwargs):
+            with self._instrumentation.phase(self._phase):
+                return attribute(*args, **kwargs)
+        return wrapper
+
+instrumentation = Instrumentation.from_environment()
@@ -0,0 +1,1239 @@
+import argparse
+import bisect
+import csv
+import heapq
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import sqlite3
+import sys
+import threading
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+INVENTORY_FILE = "inventory.json"
+LOCATIONS_FILE = "locations.json"
+LOCATION_IMAGES_FILE = "location_images.json"
+DATABASE_FILE = "inventario.db"
+JOURNAL_FILE = "inventory.journal"  # Cambios pendientes de incorporar a inventory.json
+LOANS_FILE = "prestamos.jsonl"  # Historial de préstamos y devoluciones, un movimiento por línea
+JOURNAL_COMPACT_THRESHOLD = 1000  # Registros del diario a partir de los que se compacta
+# "diario" añade un registro por cambio; "json" reescribe inventory.json completo cada vez;
+# "sqlite" guarda todo en inventario.db y migra los JSON existentes la primera vez
+STORAGE_MODE = os.environ.get("INVENTARIO_ALMACENAMIENTO", "diario")
+SIMILARITY_THRESHOLD = 0.3  # Similitud mínima (coeficiente de Dice sobre trigramas) para sugerir una herramienta
+SIMILAR_MATCHES_LIMIT = 20  # Máximo de sugerencias por similitud
+SEARCH_CACHE_SIZE = 512  # Búsquedas parciales recordadas antes de vaciar la caché
+LOAN_HISTORY_LIMIT = 50  # Préstamos ya devueltos que se recuerdan por persona
+RECONCILE_THRESHOLD = 0.5  # Similitud mínima para dar por buena una línea del recuento sin coincidencia exacta
+RECONCILE_MARGIN = 0.05  # Si otro nombre se queda a menos de esto del mejor, la línea es ambigua
+RECONCILE_CHUNK = 250  # Líneas distintas que se envían juntas a cada proceso
+
+# Posición de cada campo en el constructor de GardenTool, con las claves en español del
+# archivo y las antiguas en inglés
+FIELD_POSITIONS = {
+    "número": 0, "nombre": 1, "ubicación": 2, "quien_se_la_lleva": 3,
+    "number": 0, "name": 1, "location": 2, "borrowed_by": 3,
+}
+
+def intern_location(location):
+    # Miles de herramientas comparten unas pocas ubicaciones: se guarda una sola copia de cada texto
+    return sys.intern(location) if isinstance(location, str) else location
+
+class GardenTool:
+    __slots__ = ("number", "name", "location", "borrowed_by")
+
+    def __init__(self, number, name, location, borrowed_by=None):
+        self.number = number
+        self.name = name
+        self.location = intern_location(location)
+        self.borrowed_by = borrowed_by
+
+    def __str__(self):
+        return f"{self.number}: {self.name}"
+
+    def to_dict(self):
+        return {
+            "número": self.number,
+            "nombre": self.name,
+            "ubicación": self.location,
+            "quien_se_la_lleva": self.borrowed_by
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls.from_pairs(data.items())
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        # Sirve como object_pairs_hook de json: crea la herramienta sin pasar por un dict intermedio
+        values = [None, None, None, None]
+        for key, value in pairs:
+            position = FIELD_POSITIONS.get(key)
+            if position is not None:
+                values[position] = value
+        return cls(*values)
+
+class ToolColumns:
+    # Almacén por columnas para inventarios muy grandes de solo lectura (exportaciones,
+    # informes): números en un array, ubicaciones como índices a una tabla y solo se
+    # guardan los préstamos que existen. Las herramientas se crean al recorrerlo.
+    def __init__(self):
+        self.numbers = array("q")
+        self.names = []
+        self.location_ids = array("I")
+        self.location_table = []
+        self.location_index = {}
+        self.borrowers = {}
+        self.sorted = True
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def append(self, number, name, location, borrowed_by=None):
+        location_id = self.location_index.get(location)
+        if location_id is None:
+            location_id = self.location_index[location] = len(self.location_table)
+            self.location_table.append(location)
+        if self.numbers and number < self.numbers[-1]:
+            self.sorted = False
+        if borrowed_by is not None:
+            self.borrowers[len(self.numbers)] = borrowed_by
+        self.numbers.append(number)
+        self.names.append(name)
+        self.location_ids.append(location_id)
+
+    def tool(self, index):
+        return GardenTool(self.numbers[index], self.names[index],
+                          self.location_table[self.location_ids[index]], self.borrowers.get(index))
+
+    def __iter__(self):
+        for index in range(len(self.numbers)):
+            yield self.tool(index)
+
+    def get(self, number):
+        if self.sorted:
+            index = bisect.bisect_left(self.numbers, number)
+            if index < len(self.numbers) and self.numbers[index] == number:
+                return self.tool(index)
+            return None
+        for index, value in enumerate(self.numbers):
+            if value == number:
+                return self.tool(index)
+        return None
+
+    @classmethod
+    def from_json(cls, path):
+        columns = cls()
+
+        def add_pairs(pairs):
+            values = [None, None, None, None]
+            for key, value in pairs:
+                position = FIELD_POSITIONS.get(key)
+                if position is not None:
+                    values[position] = value
+            columns.append(*values)
+        # El hook no devuelve nada: la lista que construye json solo contiene None
+        load_json(path, [], object_pairs_hook=add_pairs)
+        return columns
+
+def normalize_text(text):
+    # Minúsculas y sin tildes, para que "ubicación" y "ubicacion" coincidan
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+def trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    # Índice de trigramas de los nombres. Solo se puntúan las herramientas que comparten
+    # algún trigrama con la búsqueda, en lugar de comparar con todo el inventario.
+    # La búsqueda por similitud puede ejecutarse en otro hilo, de ahí el cerrojo.
+    def __init__(self):
+        self.tools = {}
+        self.names = {}
+        self.sizes = {}
+        self.postings = {}
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def add(self, tool):
+        name = normalize_text(tool.name)
+        grams = trigrams(name)
+        with self.lock:
+            self.results.clear()
+            self.tools[tool.number] = tool
+            self.names[tool.number] = name
+            self.sizes[tool.number] = len(grams)
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(tool.number)
+
+    def remove(self, tool):
+        with self.lock:
+            self.results.clear()
+            name = self.names.pop(tool.number)
+            del self.tools[tool.number]
+            del self.sizes[tool.number]
+            for gram in trigrams(name):
+                numbers = self.postings[gram]
+                numbers.discard(tool.number)
+                if not numbers:
+                    del self.postings[gram]
+
+    def substring(self, query):
+        query = normalize_text(query)
+        with self.lock:
+            numbers = self.results.get(query)
+            if numbers is None:
+                numbers = [number for number in self.substring_candidates(query) if query in self.names[number]]
+                if len(self.results) >= SEARCH_CACHE_SIZE:
+                    self.results.clear()
+                self.results[query] = numbers
+            return [self.tools[number] for number in numbers]
+
+    def substring_candidates(self, query):
+        # Al añadir una letra, los resultados solo pueden ser un subconjunto de los del prefijo
+        for end in range(len(query) - 1, 0, -1):
+            previous = self.results.get(query[:end])
+            if previous is not None:
+                return previous
+        grams = {query[i:i + 3] for i in range(len(query) - 2)}
+        if not grams:
+            return sorted(self.names)
+        # Cualquier nombre que contenga la búsqueda contiene todos sus trigramas
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        return sorted(set(postings[0]).intersection(*postings[1:]))
+
+    def search(self, query, limit=SIMILAR_MATCHES_LIMIT, threshold=SIMILARITY_THRESHOLD):
+        grams = trigrams(normalize_text(query))
+        shared = Counter()
+        # Un nombre con count trigramas en común tiene al menos count trigramas, así que su
+        # puntuación no pasa de 2 * count / (len(grams) + count): por debajo de este mínimo
+        # no hace falta calcularla
+        minimum = threshold * len(grams) / (2 - threshold)
+        # Bajo el cerrojo solo se copian las listas de los trigramas; la puntuación se hace
+        # fuera para no bloquear al hilo de Tk mientras añade o busca
+        with self.lock:
+            postings = [list(self.postings.get(gram, ())) for gram in grams]
+        for numbers in postings:
+            shared.update(numbers)
+        scored = []
+        for number, count in shared.items():
+            if count < minimum:
+                continue
+            size = self.sizes.get(number)
+            if size is None:
+                # Borrada mientras tanto
+                continue
+            score = 2 * count / (len(grams) + size)
+            if score >= threshold:
+                scored.append((score, -number))
+        results = []
+        for score, number in heapq.nlargest(limit, scored):
+            tool = self.tools.get(-number)
+            if tool is not None:
+                results.append((tool, score))
+        return results
+
+class NumberAllocator:
+    # Números libres: los huecos que dejan los borrados se guardan como tramos (inicio, fin)
+    # ordenados y sin solapes, así un número suelto como 10 000 000 deja un solo tramo y no
+    # diez millones de entradas; el resto son los posteriores al mayor número usado.
+    def __init__(self):
+        self.gaps = []
+        self.next_number = 1
+
+    def find_gap(self, number):
+        # Índice del tramo que contiene el número, o None
+        index = bisect.bisect_left(self.gaps, (number + 1,)) - 1
+        if index >= 0 and number < self.gaps[index][1]:
+            return index
+        return None
+
+    def mark_used(self, number):
+        if number >= self.next_number:
+            if number > self.next_number:
+                self.add_gap(self.next_number, number)
+            self.next_number = number + 1
+            return
+        index = self.find_gap(number)
+        if index is None:
+            return
+        start, end = self.gaps[index]
+        pieces = [(a, b) for a, b in ((start, number), (number + 1, end)) if a < b]
+        self.gaps[index:index + 1] = pieces
+
+    def release(self, number):
+        if number >= self.next_number or self.find_gap(number) is not None:
+            return
+        if number == self.next_number - 1:
+            # El mayor número usado: el final vuelve a empezar antes, junto con el hueco anterior
+            self.next_number = number
+            if self.gaps and self.gaps[-1][1] == number:
+                self.next_number = self.gaps.pop()[0]
+            return
+        self.add_gap(number, number + 1)
+
+    def add_gap(self, start, end):
+        index = bisect.bisect_left(self.gaps, (start, end))
+        # Se une con los tramos vecinos si se tocan
+        if index > 0 and self.gaps[index - 1][1] == start:
+            index -= 1
+            start = self.gaps[index][0]
+            del self.gaps[index]
+        if index < len(self.gaps) and self.gaps[index][0] == end:
+            end = self.gaps[index][1]
+            del self.gaps[index]
+        self.gaps.insert(index, (start, end))
+
+    def allocate(self):
+        if self.gaps:
+            start, end = self.gaps[0]
+            if start + 1 < end:
+                self.gaps[0] = (start + 1, end)
+            else:
+                del self.gaps[0]
+            return start
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def reserve(self, count):
+        # Para altas masivas: primero los huecos, tramo a tramo, y después un bloque contiguo al final
+        numbers = []
+        while self.gaps and len(numbers) < count:
+            start, end = self.gaps[0]
+            taken = min(end - start, count - len(numbers))
+            numbers.extend(range(start, start + taken))
+            if start + taken < end:
+                self.gaps[0] = (start + taken, end)
+            else:
+                del self.gaps[0]
+        remaining = count - len(numbers)
+        numbers.extend(range(self.next_number, self.next_number + remaining))
+        self.next_number += remaining
+        return numbers
+
+class Loan:
+    __slots__ = ("number", "borrower", "since", "returned")
+
+    def __init__(self, number, borrower, since, returned=None):
+        self.number = number
+        self.borrower = borrower
+        self.since = since  # None en los préstamos anteriores al historial
+        self.returned = returned
+
+    def to_dict(self):
+        return {
+            "número": self.number,
+            "quien_se_la_lleva": self.borrower,
+            "desde": self.since.isoformat() if self.since else None,
+            "hasta": self.returned.isoformat() if self.returned else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        since, returned = data["desde"], data["hasta"]
+        return cls(data["número"], data["quien_se_la_lleva"], since and datetime.fromisoformat(since),
+                   returned and datetime.fromisoformat(returned))
+
+def now():
+    return datetime.now().replace(microsecond=0)
+
+class LoanLedger:
+    # Préstamos abiertos indexados por herramienta, por persona y por antigüedad. Los
+    # movimientos se registran en orden de fecha, así que open_loans (un OrderedDict)
+    # va del préstamo más antiguo al más reciente y los atrasados se leen desde el
+    # principio hasta el primero que no lo está. De los devueltos solo se guardan los
+    # últimos de cada persona; el historial completo queda en el almacenamiento.
+    def __init__(self, events=()):
+        self.open_loans = OrderedDict()
+        self.by_borrower = {}
+        self.history = {}
+        for event in events:
+            self.apply(event)
+
+    def apply(self, event):
+        when = datetime.fromisoformat(event["fecha"])
+        if event["op"] == "prestar":
+            self.open(Loan(event["número"], event["quien_se_la_lleva"], when))
+        else:
+            self.close(event["número"], when)
+
+    def open(self, loan):
+        self.close(loan.number, loan.since)
+        self.open_loans[loan.number] = loan
+        self.by_borrower.setdefault(loan.borrower, {})[loan.number] = loan
+
+    def close(self, number, when):
+        loan = self.open_loans.pop(number, None)
+        if loan is None:
+            return None
+        loans = self.by_borrower[loan.borrower]
+        del loans[number]
+        if not loans:
+            del self.by_borrower[loan.borrower]
+        loan.returned = when
+        self.history.setdefault(loan.borrower, deque(maxlen=LOAN_HISTORY_LIMIT)).append(loan)
+        return loan
+
+    def adopt(self, tools):
+        # Herramientas prestadas antes de existir el historial: fecha desconocida, las más antiguas
+        for tool in tools:
+            if tool.borrowed_by and tool.number not in self.open_loans:
+                self.open(Loan(tool.number, tool.borrowed_by, None))
+                self.open_loans.move_to_end(tool.number, last=False)
+
+    def lend(self, number, borrower):
+        when = now()
+        self.open(Loan(number, borrower, when))
+        return {"op": "prestar", "número": number, "quien_se_la_lleva": borrower, "fecha": when.isoformat()}
+
+    def give_back(self, number):
+        when = now()
+        loan = self.close(number, when)
+        if loan is None:
+            return None
+        return {"op": "devolver", "número": number, "quien_se_la_lleva": loan.borrower, "fecha": when.isoformat()}
+
+    def borrowers(self):
+        return sorted(self.by_borrower)
+
+    def loans_of(self, borrower):
+        # Abiertos (del más antiguo al más reciente) y los últimos devueltos (del más reciente)
+        return list(self.by_borrower.get(borrower, {}).values()), list(reversed(self.history.get(borrower, ())))
+
+    def overdue(self, days):
+        cutoff = now().timestamp() - days * 86400
+        loans = []
+        for loan in self.open_loans.values():
+            if loan.since and loan.since.timestamp() > cutoff:
+                break
+            loans.append(loan)
+        return loans
+
+class Inventory:
+    # Herramientas indexadas por número y por ubicación, con un índice inverso de cada
+    # imagen a las ubicaciones que la usan. Todos los cambios deben pasar por aquí para
+    # que los índices no se desincronicen.
+    def __init__(self, tools=()):
+        self.by_number = {}
+        self.by_location = {}
+        self.location_images = {}
+        self.image_locations = {}
+        self.search_index = SearchIndex()
+        self.numbers = NumberAllocator()
+        for tool in tools:
+            self.add(tool)
+
+    def __iter__(self):
+        return iter(self.by_number.values())
+
+    def __len__(self):
+        return len(self.by_number)
+
+    def get(self, number):
+        return self.by_number.get(number)
+
+    def add(self, tool):
+        self.by_number[tool.number] = tool
+        self.by_location.setdefault(tool.location, {})[tool.number] = tool
+        self.search_index.add(tool)
+        self.numbers.mark_used(tool.number)
+
+    def remove(self, tool):
+        del self.by_number[tool.number]
+        self.unlink_location(tool)
+        self.search_index.remove(tool)
+        self.numbers.release(tool.number)
+
+    def update(self, tool, name, location):
+        if location != tool.location:
+            self.unlink_location(tool)
+            tool.location = intern_location(location)
+            self.by_location.setdefault(location, {})[tool.number] = tool
+        if name != tool.name:
+            self.search_index.remove(tool)
+            tool.name = name
+            self.search_index.add(tool)
+
+    def unlink_location(self, tool):
+        tools = self.by_location.get(tool.location)
+        if tools is not None:
+            tools.pop(tool.number, None)
+            if not tools:
+                del self.by_location[tool.location]
+
+    def tools_at(self, location):
+        return list(self.by_location.get(location, {}).values())
+
+    def set_location_image(self, location, image):
+        previous = self.location_images.get(location)
+        if previous is not None:
+            self.image_locations[previous].discard(location)
+            if not self.image_locations[previous]:
+                del self.image_locations[previous]
+        self.location_images[location] = image
+        self.image_locations.setdefault(image, set()).add(location)
+
+    def tools_for_image(self, image):
+        tools = []
+        for location in self.image_locations.get(image, ()):
+            tools.extend(self.by_location.get(location, {}).values())
+        tools.sort(key=lambda tool: tool.number)
+        return tools
+
+def write_json_atomic(path, data):
+    # Se escribe en un archivo temporal y se renombra: un corte a mitad nunca deja el archivo a medias
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+def load_json(path, default, object_pairs_hook=None):
+    try:
+        with open(path, "r") as f:
+            return json.load(f, object_pairs_hook=object_pairs_hook)
+    except FileNotFoundError:
+        return default
+
+def trim_torn_line(path):
+    # Un corte de luz a mitad de una escritura deja la última línea incompleta: se recorta
+    # hasta el último salto de línea para que lo siguiente que se añada no se pegue a ella
+    try:
+        with open(path, "rb+") as f:
+            end = position = f.seek(0, os.SEEK_END)
+            while position > 0:
+                start = max(0, position - 4096)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                f.truncate(position)
+    except FileNotFoundError:
+        pass
+
+class JsonStorage:
+    # Reescribe el inventario completo en cada cambio
+    def __init__(self, path=INVENTORY_FILE, locations_path=LOCATIONS_FILE, location_images_path=LOCATION_IMAGES_FILE,
+                 loans_path=LOANS_FILE):
+        self.path = path
+        self.locations_path = locations_path
+        self.location_images_path = location_images_path
+        self.loans_path = loans_path
+
+    def load(self):
+        return load_json(self.path, [], object_pairs_hook=GardenTool.from_pairs)
+
+    def iter_tools(self):
+        # Para exportar: las columnas ocupan mucho menos que la lista de herramientas y cada
+        # herramienta se crea solo al recorrerlas
+        return iter(ToolColumns.from_json(self.path))
+
+    def record(self, inventory, changes):
+        write_json_atomic(self.path, [tool.to_dict() for tool in inventory])
+
+    def load_locations(self):
+        return load_json(self.locations_path, [])
+
+    def add_location(self, locations, location):
+        write_json_atomic(self.locations_path, locations)
+
+    def load_location_images(self):
+        return load_json(self.location_images_path, {})
+
+    def set_location_image(self, location_images, location, image):
+        write_json_atomic(self.location_images_path, location_images)
+
+    def load_loans(self):
+        events = []
+        try:
+            with open(self.loans_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # Línea a medias de un corte de luz: se pierde ese movimiento, no el historial
+                        continue
+        except FileNotFoundError:
+            pass
+        return events
+
+    def record_loans(self, events):
+        # El historial solo crece: se añaden las líneas nuevas, nunca se reescribe. Si el
+        # archivo acaba en una línea a medias, lo nuevo empieza en una línea aparte.
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8")
+        with open(self.loans_path, "ab+") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+class JournalStorage(JsonStorage):
+    # Instantánea en inventory.json más un diario en el que cada cambio añade una línea.
+    # Al cargar se reaplica el diario sobre la instantánea; cuando crece demasiado se
+    # compacta en segundo plano escribiendo una instantánea nueva.
+    def __init__(self, path=INVENTORY_FILE, journal_path=JOURNAL_FILE, compact_threshold=JOURNAL_COMPACT_THRESHOLD):
+        super().__init__(path)
+        self.journal_path = journal_path
+        self.compacting_path = journal_path + ".compactando"
+        self.compact_threshold = compact_threshold
+        self.journal = None
+        self.records = 0
+        self.compaction = None
+
+    def load(self):
+        inventory = self.read()
+        trim_torn_line(self.journal_path)
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        if self.records >= self.compact_threshold:
+            self.compact(inventory)
+        return inventory
+
+    def read(self):
+        # Instantánea más diario, sin abrir el diario para escritura
+        tools = {tool.number: tool for tool in super().load()}
+        self.records = 0
+        # El diario que se estaba compactando va antes que el actual
+        for journal_path in (self.compacting_path, self.journal_path):
+            self.records += self.replay(journal_path, tools)
+        return list(tools.values())
+
+    def iter_tools(self):
+        # El diario se reaplica sobre la instantánea entera, pero sin abrirlo ni compactarlo
+        return iter(self.read())
+
+    def replay(self, journal_path, tools):
+        count = 0
+        try:
+            with open(journal_path, "r", encoding="utf-8") as f:
+                for number, line in enumerate(f, 1):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Solo puede faltar el final de la última línea (cierre inesperado al
+                        # escribirla); una línea dañada en medio no se salta en silencio
+                        if line.endswith("\n"):
+                            raise ValueError(f"{journal_path} está dañado en la línea {number}")
+                        continue
+                    if entry["op"] == "borrar":
+                        tools.pop(entry["número"], None)
+                    else:
+                        tool = GardenTool.from_dict(entry["herramienta"])
+                        existing = tools.get(tool.number)
+                        if existing:
+                            existing.name = tool.name
+                            existing.location = tool.location
+                            existing.borrowed_by = tool.borrowed_by
+                        else:
+                            tools[tool.number] = tool
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return count
+
+    def record(self, inventory, changes):
+        lines = []
+        for tool, deleted in changes:
+            if deleted:
+                entry = {"op": "borrar", "número": tool.number}
+            else:
+                entry = {"op": "guardar", "herramienta": tool.to_dict()}
+            lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.journal.write("".join(lines))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.records += len(lines)
+        if self.records >= self.compact_threshold:
+            self.compact(inventory)
+
+    def compact(self, inventory):
+        if self.compaction and self.compaction.is_alive():
+            return
+        # La copia de los datos y el cambio de diario se hacen en este hilo, así ningún
+        # registro nuevo puede colarse entre la instantánea y el diario vacío
+        data = [tool.to_dict() for tool in inventory]
+        self.journal.close()
+        if os.path.exists(self.compacting_path):
+            # Una compactación anterior falló: se conservan sus registros
+            with open(self.compacting_path, "a", encoding="utf-8") as target, open(self.journal_path, "r", encoding="utf-8") as source:
+                target.write(source.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.compacting_path)
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        self.records = 0
+        self.compaction = threading.Thread(target=self.write_snapshot, args=(data,), name="compactacion")
+        self.compaction.start()
+
+    def write_snapshot(self, data):
+        write_json_atomic(self.path, data)
+        os.remove(self.compacting_path)
+
+    def close(self):
+        if self.compaction:
+            self.compaction.join()
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+class SQLiteStorage:
+    # Herramientas, ubicaciones e imágenes en una sola base de datos; cada cambio toca
+    # solo sus filas y se confirma en una transacción
+    def __init__(self, path=DATABASE_FILE):
+        if not os.path.exists(path):
+            self.migrate(path)
+        # La carga inicial se hace en un hilo de fondo; el resto de accesos, desde el de Tk,
+        # nunca a la vez
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.create_schema()
+
+    def migrate(self, path):
+        # Se migra a un archivo aparte que solo se pone en su sitio si la copia termina: si
+        # falla, el siguiente arranque lo vuelve a intentar en lugar de abrir una base vacía
+        temporary_path = path + ".tmp"
+        for leftover in (temporary_path, temporary_path + "-journal"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        self.connection = sqlite3.connect(temporary_path)
+        try:
+            self.create_schema()
+            migrate_json_to_sqlite(self)
+        finally:
+            self.connection.close()
+        os.replace(temporary_path, path)
+
+    def create_schema(self):
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS tools (
+                    number INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    borrowed_by TEXT
+                );
+                CREATE INDEX IF NOT EXISTS tools_location ON tools (location);
+                CREATE INDEX IF NOT EXISTS tools_borrowed_by ON tools (borrowed_by);
+                CREATE TABLE IF NOT EXISTS locations (
+                    name TEXT PRIMARY KEY
+                );
+                CREATE TABLE IF NOT EXISTS location_images (
+                    location TEXT PRIMARY KEY,
+                    image TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS location_images_image ON location_images (image);
+                CREATE TABLE IF NOT EXISTS loans (
+                    id INTEGER PRIMARY KEY,
+                    op TEXT NOT NULL,
+                    number INTEGER NOT NULL,
+                    borrower TEXT,
+                    at TEXT NOT NULL
+                );
+            """)
+
+    def load(self):
+        rows = self.connection.execute("SELECT number, name, location, borrowed_by FROM tools ORDER BY number")
+        return [GardenTool(*row) for row in rows]
+
+    def iter_tools(self):
+        # Fila a fila desde el cursor, sin cargar la tabla entera
+        for row in self.connection.execute("SELECT number, name, location, borrowed_by FROM tools ORDER BY number"):
+            yield GardenTool(*row)
+
+    def record(self, inventory, changes):
+        with self.connection:
+            for tool, deleted in changes:
+                if deleted:
+                    self.connection.execute("DELETE FROM tools WHERE number = ?", (tool.number,))
+                else:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO tools (number, name, location, borrowed_by) VALUES (?, ?, ?, ?)",
+                        (tool.number, tool.name, tool.location, tool.borrowed_by))
+
+    def load_locations(self):
+        return [row[0] for row in self.connection.execute("SELECT name FROM locations ORDER BY rowid")]
+
+    def add_location(self, locations, location):
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO locations (name) VALUES (?)", (location,))
+
+    def load_location_images(self):
+        return dict(self.connection.execute("SELECT location, image FROM location_images"))
+
+    def set_location_image(self, location_images, location, image):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO location_images (location, image) VALUES (?, ?)", (location, image))
+
+    def load_loans(self):
+        rows = self.connection.execute("SELECT op, number, borrower, at FROM loans ORDER BY id")
+        return [{"op": op, "número": number, "quien_se_la_lleva": borrower, "fecha": at} for op, number, borrower, at in rows]
+
+    def record_loans(self, events):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO loans (op, number, borrower, at) VALUES (?, ?, ?, ?)",
+                ((event["op"], event["número"], event["quien_se_la_lleva"], event["fecha"]) for event in events))
+
+    def close(self):
+        self.connection.close()
+
+def migrate_json_to_sqlite(storage, source=None):
+    # Copia única de los archivos JSON (incluido el diario pendiente) a la base de datos
+    source = source or JournalStorage()
+    tools = source.read()
+    locations = source.load_locations()
+    location_images = source.load_location_images()
+    loans = source.load_loans()
+    with storage.connection:
+        storage.connection.executemany(
+            "INSERT OR REPLACE INTO tools (number, name, location, borrowed_by) VALUES (?, ?, ?, ?)",
+            ((tool.number, tool.name, tool.location, tool.borrowed_by) for tool in tools))
+        storage.connection.executemany("INSERT OR IGNORE INTO locations (name) VALUES (?)", ((location,) for location in locations))
+        storage.connection.executemany(
+            "INSERT OR REPLACE INTO location_images (location, image) VALUES (?, ?)", location_images.items())
+        storage.connection.executemany(
+            "INSERT INTO loans (op, number, borrower, at) VALUES (?, ?, ?, ?)",
+            ((event["op"], event["número"], event["quien_se_la_lleva"], event["fecha"]) for event in loans))
+
+def create_storage(mode=STORAGE_MODE):
+    if mode == "json":
+        return JsonStorage()
+    if mode == "diario":
+        return JournalStorage()
+    if mode == "sqlite":
+        return SQLiteStorage()
+    raise ValueError(f"Modo de almacenamiento desconocido: {mode}")
+
+class InventoryManager:
+    # Operaciones del inventario sin interfaz gráfica. La ventana y la línea de órdenes
+    # pasan por aquí; dentro de batch() todos los cambios se guardan en una sola escritura.
+    def __init__(self, storage=None):
+        self.storage = storage or create_storage()
+        self.inventory = Inventory()
+        self.locations = []
+        self.loans = LoanLedger()
+        self.pending = None
+        self.pending_loans = None
+
+    def load(self):
+        # El inventario se construye completo antes de publicarlo, porque puede cargarse
+        # en un hilo de fondo mientras la ventana ya lo está leyendo
+        inventory = Inventory(self.storage.load())
+        for location, image in self.storage.load_location_images().items():
+            inventory.set_location_image(location, image)
+        self.locations = self.storage.load_locations()
+        loans = LoanLedger(self.storage.load_loans())
+        loans.adopt(inventory)
+        self.loans = loans
+        self.inventory = inventory
+
+    def add_tool(self, name, location, number=None, borrowed_by=None):
+        if not name or not location:
+            raise ValueError("Nombre y ubicación no pueden estar vacíos")
+        if number is None:
+            number = self.inventory.numbers.allocate()
+        elif self.inventory.get(number):
+            raise ValueError(f"Ya existe una herramienta con el número {number}")
+        tool = GardenTool(number, name, location, borrowed_by)
+        self.inventory.add(tool)
+        if borrowed_by:
+            self.record_loan(self.loans.lend(number, borrowed_by))
+        self.record(tool)
+        return tool
+
+    def update_tool(self, tool, name, location):
+        if not name or not location:
+            raise ValueError("Nombre y ubicación no pueden estar vacíos")
+        self.inventory.update(tool, name, location)
+        self.record(tool)
+
+    def delete_tool(self, tool):
+        self.inventory.remove(tool)
+        self.record_loan(self.loans.give_back(tool.number))
+        self.record(tool, deleted=True)
+
+    def lend_tool(self, tool, borrower):
+        if not borrower:
+            raise ValueError("Por favor, introduce el nombre de la persona que se lleva la herramienta")
+        if borrower != tool.borrowed_by:
+            # Si la tenía otra persona, primero consta que la devolvió
+            self.record_loan(self.loans.give_back(tool.number))
+            self.record_loan(self.loans.lend(tool.number, borrower))
+        tool.borrowed_by = borrower
+        self.record(tool)
+
+    def return_tool(self, tool):
+        self.record_loan(self.loans.give_back(tool.number))
+        tool.borrowed_by = None
+        self.record(tool)
+
+    def borrowers(self):
+        return self.loans.borrowers()
+
+    def loans_of(self, borrower):
+        return self.loans.loans_of(borrower)
+
+    def overdue_loans(self, days):
+        return self.loans.overdue(days)
+
+    def find(self, search_term):
+        # Número exacto y coincidencias parciales; si no hay ninguna, las más parecidas.
+        # Devuelve las herramientas y si son resultado de la búsqueda por similitud.
+        matches = self.inventory.search_index.substring(search_term)
+        number_match = self.inventory.get(int(search_term)) if search_term.isdecimal() else None
+        if number_match:
+            matches.insert(0, number_match)
+        if matches:
+            return matches, False
+        return [tool for tool, score in self.inventory.search_index.search(search_term)], True
+
+    def add_location(self, location):
+        if not location or location in self.locations:
+            return False
+        self.locations.append(location)
+        self.storage.add_location(self.locations, location)
+        return True
+
+    def set_location_image(self, location, image):
+        self.inventory.set_location_image(location, image)
+        self.storage.set_location_image(self.inventory.location_images, location, image)
+
+    def record(self, tool, deleted=False):
+        if self.pending is not None:
+            self.pending.append((tool, deleted))
+        else:
+            self.storage.record(self.inventory, [(tool, deleted)])
+
+    def record_loan(self, event):
+        if event is None:
+            return
+        if self.pending_loans is not None:
+            self.pending_loans.append(event)
+        else:
+            self.storage.record_loans([event])
+
+    @contextmanager
+    def batch(self):
+        # Todo o nada: si el bloque termina con una excepción no se guarda ningún cambio (y
+        # la memoria deja de coincidir con el disco, así que hay que volver a cargar)
+        self.pending = []
+        self.pending_loans = []
+        try:
+            yield
+        except BaseException:
+            self.pending = self.pending_loans = None
+            raise
+        changes, self.pending = self.pending, None
+        loans, self.pending_loans = self.pending_loans, None
+        if changes:
+            self.storage.record(self.inventory, changes)
+        if loans:
+            self.storage.record_loans(loans)
+
+    def close(self):
+        self.storage.close()
+
+EXPORT_FIELDS = ["número", "nombre", "ubicación", "quien_se_la_lleva"]
+
+def file_format(path, requested=None):
+    if requested:
+        return requested
+    return "jsonl" if path.lower().endswith(".jsonl") else "csv"
+
+@contextmanager
+def open_stream(path, mode):
+    # "-" es la entrada o salida estándar
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+    else:
+        # utf-8-sig acepta los CSV guardados desde Excel, que empiezan con BOM
+        with open(path, mode, encoding="utf-8-sig" if mode == "r" else "utf-8", newline="") as f:
+            yield f
+
+def read_records(path, requested_format=None):
+    # Lee fila a fila para no cargar el archivo entero en memoria
+    with open_stream(path, "r") as f:
+        if file_format(path, requested_format) == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def optional_number(value):
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Número no válido: {value}") from None
+
+def export_tools(tools, path, requested_format=None):
+    count = 0
+    with open_stream(path, "w") as f:
+        if file_format(path, requested_format) == "jsonl":
+            for tool in tools:
+                f.write(json.dumps(tool.to_dict(), ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for tool in tools:
+                writer.writerow(tool.to_dict())
+                count += 1
+    return count
+
+def import_tools(manager, path, requested_format=None):
+    # Las filas con un número existente actualizan esa herramienta; el resto se añaden.
+    # Una fila incorrecta se avisa y se salta sin tocar nada; las demás se guardan juntas.
+    # Las filas sin número se dan de alta al final, con números reservados de una vez: así
+    # ninguna ocupa el número que trae una fila posterior de la hoja.
+    count = 0
+    unnumbered = []
+    with manager.batch():
+        for row, record in enumerate(read_records(path, requested_format), 1):
+            try:
+                number = optional_number(record.get("número"))
+                name = record.get("nombre")
+                location = str(record.get("ubicación") or "")
+                borrowed_by = record.get("quien_se_la_lleva") or None
+                if number is None:
+                    if not name or not location:
+                        raise ValueError("Nombre y ubicación no pueden estar vacíos")
+                    unnumbered.append((name, location, borrowed_by))
+                    continue
+                tool = manager.inventory.get(number)
+                if tool:
+                    manager.update_tool(tool, name, location)
+                    # Por lend_tool/return_tool para que el cambio conste en el historial de préstamos
+                    if borrowed_by:
+                        manager.lend_tool(tool, borrowed_by)
+                    elif tool.borrowed_by:
+                        manager.return_tool(tool)
+                else:
+                    manager.add_tool(name, location, number, borrowed_by)
+            except ValueError as e:
+                print(f"Fila {row} descartada: {e}", file=sys.stderr)
+                continue
+            manager.add_location(location)
+            count += 1
+        numbers = manager.inventory.numbers.reserve(len(unnumbered))
+        for number, (name, location, borrowed_by) in zip(numbers, unnumbered):
+            manager.add_tool(name, location, number, borrowed_by)
+            manager.add_location(location)
+            count += 1
+    return count
+
+def lend_tools(manager, path, requested_format=None):
+    count = 0
+    with manager.batch():
+        for row, record in enumerate(read_records(path, requested_format), 1):
+            try:
+                tool = manager.inventory.get(optional_number(record.get("número")))
+                if tool is None:
+                    print(f"Herramienta no encontrada: {record.get('número')}", file=sys.stderr)
+                    continue
+                manager.lend_tool(tool, record.get("quien_se_la_lleva"))
+            except ValueError as e:
+                print(f"Fila {row} descartada: {e}", file=sys.stderr)
+                continue
+            count += 1
+    return count
+
+def return_tools(manager, path, requested_format=None):
+    count = 0
+    with manager.batch():
+        for row, record in enumerate(read_records(path, requested_format), 1):
+            try:
+                tool = manager.inventory.get(optional_number(record.get("número")))
+                if tool is None:
+                    print(f"Herramienta no encontrada: {record.get('número')}", file=sys.stderr)
+                    continue
+                manager.return_tool(tool)
+            except ValueError as e:
+                print(f"Fila {row} descartada: {e}", file=sys.stderr)
+                continue
+            count += 1
+    return count
+
+REPORT_FIELDS = ["estado", "línea", "número", "nombre", "ubicación", "candidatos"]
+
+# Estado de cada proceso de conciliar: un índice de trigramas de los nombres distintos del
+# inventario (no de cada herramienta: diez "Pala" son un solo nombre)
+reconcile_names = []
+reconcile_exact = {}
+reconcile_index = None
+
+def init_reconcile_worker(names):
+    global reconcile_names, reconcile_exact, reconcile_index
+    reconcile_names = names
+    reconcile_exact = {name: name_id for name_id, name in enumerate(names)}
+    reconcile_index = SearchIndex()
+    for name_id, name in enumerate(names):
+        reconcile_index.add(GardenTool(name_id, name, None))
+
+def match_audit_lines(queries):
+    # Para cada línea: el nombre exacto, los que la contienen o los más parecidos con su puntuación
+    results = []
+    for query in queries:
+        name_id = reconcile_exact.get(query)
+        if name_id is not None:
+            results.append([(name_id, 1.0)])
+            continue
+        partial = reconcile_index.substring(query)
+        if partial:
+            results.append([(tool.number, 1.0) for tool in partial])
+        else:
+            results.append([(tool.number, score) for tool, score in reconcile_index.search(query, threshold=RECONCILE_THRESHOLD)])
+    return results
+
+def unclaimed(name, tools_by_name, next_free, counted):
+    # Las herramientas de cada nombre se reparten por orden de número; el puntero solo avanza
+    tools = tools_by_name[name]
+    position = next_free.get(name, 0)
+    while position < len(tools) and tools[position].number in counted:
+        position += 1
+    next_free[name] = position
+    return tools[position] if position < len(tools) else None
+
+def reconcile(inventory, lines, workers=None):
+    # Cada línea del recuento es una herramienta física: se le asigna una herramienta del
+    # inventario que no se haya contado ya. La búsqueda (lo costoso) se reparte entre
+    # procesos; la asignación se hace aquí, en el orden del archivo, pero primero los
+    # números: identifican la herramienta exacta y no deben perderla frente a un nombre.
+    tools_by_name = {}
+    for tool in sorted(inventory, key=lambda tool: tool.number):
+        tools_by_name.setdefault(normalize_text(tool.name), []).append(tool)
+    names = list(tools_by_name)
+    queries = list(dict.fromkeys(normalize_text(line) for line in lines if not line.isdecimal()))
+
+    if len(queries) <= RECONCILE_CHUNK or workers == 1:
+        init_reconcile_worker(names)
+        matches = match_audit_lines(queries)
+    else:
+        chunks = [queries[i:i + RECONCILE_CHUNK] for i in range(0, len(queries), RECONCILE_CHUNK)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_reconcile_worker, initargs=(names,)) as executor:
+            matches = [result for chunk in executor.map(match_audit_lines, chunks) for result in chunk]
+    matches = dict(zip(queries, matches))
+
+    counted = set()
+    next_free = {}
+    report = {"encontradas": [], "ambiguas": [], "inesperadas": [], "ausentes": []}
+    for line in lines:
+        if line.isdecimal():
+            tool = inventory.get(int(line))
+            if tool and tool.number not in counted:
+                counted.add(tool.number)
+                report["encontradas"].append((line, tool, []))
+            else:
+                report["inesperadas"].append((line, None, []))
+    for line in lines:
+        if line.isdecimal():
+            continue
+        scored = matches[normalize_text(line)]
+        best = max((score for name_id, score in scored), default=0)
+        close = [names[name_id] for name_id, score in scored if score >= best - RECONCILE_MARGIN]
+        if len(close) > 1:
+            report["ambiguas"].append((line, None, [tool for name in close for tool in tools_by_name[name][:1]]))
+            continue
+        tool = unclaimed(close[0], tools_by_name, next_free, counted) if close else None
+        if tool:
+            counted.add(tool.number)
+            report["encontradas"].append((line, tool, []))
+        else:
+            # Sin parecido suficiente, o ya se contaron todas las herramientas con ese nombre
+            report["inesperadas"].append((line, None, []))
+    report["ausentes"] = [("", tool, []) for tool in inventory if tool.number not in counted]
+    return report
+
+def write_report(report, path, requested_format=None):
+    states = {"encontradas": "encontrada", "ambiguas": "ambigua", "inesperadas": "inesperada", "ausentes": "ausente"}
+    with open_stream(path, "w") as f:
+        jsonl = file_format(path, requested_format) == "jsonl"
+        writer = None if jsonl else csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        if writer:
+            writer.writeheader()
+        for group, rows in report.items():
+            for line, tool, candidates in rows:
+                row = {
+                    "estado": states[group],
+                    "línea": line,
+                    "número": tool.number if tool else None,
+                    "nombre": tool.name if tool else None,
+                    "ubicación": tool.location if tool else None,
+                    "candidatos": "; ".join(str(candidate) for candidate in candidates),
+                }
+                if jsonl:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                else:
+                    writer.writerow(row)
+
+def reconcile_audit(manager, path, report_path="-", requested_format=None, workers=None):
+    with open_stream(path, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    report = reconcile(manager.inventory, lines, workers)
+    write_report(report, report_path, requested_format)
+    return {group: len(rows) for group, rows in report.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inventario de herramientas de jardín sin interfaz gráfica")
+    parser.add_argument("--almacenamiento", choices=["json", "diario", "sqlite"], default=STORAGE_MODE,
+                        help="modo de almacenamiento (por defecto, el de INVENTARIO_ALMACENAMIENTO)")
+    parser.add_argument("--formato", choices=["csv", "jsonl"],
+                        help="formato del archivo (por defecto, según la extensión)")
+    subparsers = parser.add_subparsers(dest="orden", required=True)
+    commands = {
+        "exportar": (export_tools, "exporta todas las herramientas", "exportadas"),
+        "importar": (import_tools, "añade o actualiza herramientas", "importadas"),
+        "prestar": (lend_tools, "presta las herramientas de una hoja (número, quien_se_la_lleva)", "prestadas"),
+        "devolver": (return_tools, "devuelve las herramientas de una hoja (número)", "devueltas"),
+    }
+    for name, (function, help_text, verb) in commands.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("archivo", help='archivo CSV o JSONL ("-" para la entrada o salida estándar)')
+    subparser = subparsers.add_parser("conciliar", help="compara un recuento (un nombre o número por línea) con el inventario")
+    subparser.add_argument("archivo", help='archivo de texto con el recuento ("-" para la entrada estándar)')
+    subparser.add_argument("--informe", default="-", help="archivo CSV o JSONL para el informe (por defecto, la salida estándar)")
+    subparser.add_argument("--procesos", type=int, help="procesos para buscar los nombres (por defecto, uno por núcleo)")
+    args = parser.parse_args(argv)
+
+    manager = InventoryManager(create_storage(args.almacenamiento))
+    if args.orden == "conciliar":
+        try:
+            manager.load()
+            counts = reconcile_audit(manager, args.archivo, args.informe, args.formato, args.procesos)
+        finally:
+            manager.close()
+        print(", ".join(f"{count} {group}" for group, count in counts.items()), file=sys.stderr)
+        return
+
+    function, help_text, verb = commands[args.orden]
+    try:
+        if function is export_tools:
+            # Exportar no necesita los índices: se recorren las herramientas tal como se leen
+            count = export_tools(manager.storage.iter_tools(), args.archivo, args.formato)
+        else:
+            manager.load()
+            count = function(manager, args.archivo, args.formato)
+    finally:
+        manager.close()
+    print(f"{count} herramientas {verb}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
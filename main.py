@@ -1,39 +1,383 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, font, simpledialog
 from PIL import Image, ImageTk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from datetime import datetime
+import bisect
+import hashlib
 import json
+import math
 import os
 import re
-import difflib
-
-class GardenTool:
-    def __init__(self, number, name, location, borrowed_by=None):
-        self.number = number
-        self.name = name
-        self.location = location
-        self.borrowed_by = borrowed_by
-
-    def __str__(self):
-        return f"{self.number}: {self.name}"
-
-    def to_dict(self):
-        return {
-            "número": self.number,
-            "nombre": self.name,
-            "ubicación": self.location,
-            "quien_se_la_lleva": self.borrowed_by
-        }
-
-    @classmethod
-    def from_dict(cls, data):
-        key_map = {
-            "número": "number",
-            "nombre": "name",
-            "ubicación": "location",
-            "quien_se_la_lleva": "borrowed_by"
-        }
-        data = {key_map.get(k, k): v for k, v in data.items()}
-        return cls(data["number"], data["name"], data["location"], data["borrowed_by"])
+import shutil
+import threading
+from inventario import InventoryManager, create_storage, write_json_atomic
+from instrumentacion import instrumentation
+from servidor import SERVER_ADDRESS, RemoteInventoryManager
+
+IMAGE_HEIGHT = 800  # Altura con la que se muestran las fotos de las ubicaciones
+THUMBNAIL_BOX = (400, 400)  # Tamaño máximo de las miniaturas del diálogo de selección
+PREFETCH_RADIUS = 3  # Fotos vecinas que se precargan a cada lado de la actual
+IMAGE_POLL_MS = 15  # Cada cuánto comprueba el hilo de Tk si ha terminado una decodificación
+THUMBNAIL_DIR = ".miniaturas"  # Carpeta donde se guardan las miniaturas ya generadas
+CATALOG_FILE = ".catalogo_imagenes.json"  # Datos de cabecera de las fotos de la última exploración
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+TILE_DIR = ".teselas"  # Pirámides de teselas para ampliar las fotos
+TILE_SIZE = 512
+MAX_ZOOM = 2.0  # Ampliación máxima respecto a la resolución original de la foto
+ZOOM_STEP = 1.25  # Factor de cada paso de la rueda del ratón
+SYNC_INTERVAL_MS = 1000  # Con servidor, cada cuánto se piden los cambios de los otros puestos
+OVERDUE_DAYS = 7  # Días a partir de los que un préstamo se considera atrasado
+WATCH_INTERVAL_MS = 2000  # Cada cuánto se comprueba si han cambiado las fotos de la carpeta
+SEARCH_DEBOUNCE_MS = 200  # Espera tras la última tecla antes de lanzar la búsqueda en vivo
+LIVE_SEARCH_LIMIT = 100  # Máximo de filas en la lista de resultados en vivo
+VIRTUAL_LIST_THRESHOLD = 500  # A partir de estas filas la lista solo contiene las visibles
+# Manejadores de Tk que se miden cuando INVENTARIO_INSTRUMENTAR=1
+INSTRUMENTED_HANDLERS = ("add_or_update_tool", "delete_tool", "lend_tool", "return_tool", "find_tool",
+                         "next_image", "previous_image", "update_location_image", "finish_image_load",
+                         "on_tool_select", "on_search_result_select", "run_live_search", "zoom_image", "pan_image")
+
+def rotate_image(image):
+    try:
+        exif = image._getexif()
+        if exif:
+            orientation = exif.get(274, 1)  # 274 is the orientation tag
+            if orientation == 3:
+                return image.rotate(180, expand=True)
+            elif orientation == 6:
+                return image.rotate(270, expand=True)
+            elif orientation == 8:
+                return image.rotate(90, expand=True)
+    except (AttributeError, KeyError, IndexError):
+        # No EXIF data or orientation not found, proceed without rotation
+        pass
+    return image
+
+def draft_size(image, height=None, box=None):
+    # Tamaño que hace falta antes de girar la foto para sacar de ella la altura o la caja pedidas
+    width, original_height = image.size
+    if image.getexif().get(274, 1) in (6, 8):
+        shown_width, shown_height = original_height, width
+    else:
+        shown_width, shown_height = width, original_height
+    scale = height / shown_height if height else min(box[0] / shown_width, box[1] / shown_height)
+    return math.ceil(width * scale), math.ceil(original_height * scale)
+
+def prepare_image(path, height=None, box=None):
+    with Image.open(path) as image:
+        if height or box:
+            # En los JPEG se decodifica directamente a 1/2, 1/4 u 1/8 siempre que siga siendo
+            # mayor que lo pedido; en otros formatos draft() no hace nada
+            image.draft("RGB", draft_size(image, height, box))
+        image = rotate_image(image)
+        if height:
+            width, original_height = image.size
+            new_width = int(width * (height / original_height))
+            image = image.resize((new_width, height), Image.LANCZOS)
+        elif box:
+            image.thumbnail(box)
+        else:
+            image.load()
+    return image
+
+class ThumbnailStore:
+    # Miniaturas guardadas en disco; se regeneran si cambia el tamaño o la fecha del original
+    def __init__(self, directory=THUMBNAIL_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "indice.json")
+        self.lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.index = {}
+
+    def load(self, path, box):
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        key = hashlib.sha1(f"{os.path.abspath(path)}|{box[0]}x{box[1]}".encode("utf-8")).hexdigest()
+        thumbnail_path = os.path.join(self.directory, key + ".jpg")
+        if self.index.get(key) == signature:
+            try:
+                with Image.open(thumbnail_path) as image:
+                    image.load()
+                return image
+            except OSError:
+                # Miniatura borrada o corrupta: se vuelve a generar
+                pass
+        image = prepare_image(path, box=box)
+        self.save(image, thumbnail_path)
+        with self.lock:
+            self.index[key] = signature
+            self.dirty = True
+        return image
+
+    def save(self, image, thumbnail_path):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f"{thumbnail_path}.{threading.get_ident()}.tmp"
+        image.convert("RGB").save(temporary_path, "JPEG", quality=85)
+        os.replace(temporary_path, thumbnail_path)
+
+    def discard(self, path, box):
+        key = hashlib.sha1(f"{os.path.abspath(path)}|{box[0]}x{box[1]}".encode("utf-8")).hexdigest()
+        with self.lock:
+            if self.index.pop(key, None) is not None:
+                self.dirty = True
+        try:
+            os.remove(os.path.join(self.directory, key + ".jpg"))
+        except FileNotFoundError:
+            pass
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            index = dict(self.index)
+            self.dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+class ImageCache:
+    # Caché LRU de imágenes ya rotadas y redimensionadas, limitada por memoria
+    def __init__(self, max_bytes=256 * 1024 * 1024, thumbnail_store=None):
+        self.max_bytes = max_bytes
+        self.thumbnail_store = thumbnail_store
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        # Se usa desde el hilo de Tk y desde los hilos de precarga
+        self.lock = threading.Lock()
+
+    def get(self, path, height=None, box=None):
+        # La fecha de modificación forma parte de la clave para no servir fotos reemplazadas
+        key = (path, os.path.getmtime(path), height, box)
+        with self.lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+                return image
+        # La decodificación se hace fuera del cerrojo para no bloquear a los demás hilos
+        with instrumentation.phase("decodificacion"):
+            if box and self.thumbnail_store:
+                image = self.thumbnail_store.load(path, box)
+            else:
+                image = prepare_image(path, height=height, box=box)
+        self.put(key, image)
+        return image
+
+    def peek(self, path, height=None, box=None):
+        # Devuelve la imagen solo si ya está en caché, sin decodificar nada
+        try:
+            key = (path, os.path.getmtime(path), height, box)
+        except OSError:
+            return None
+        with self.lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.image_size(self.entries[key])
+            self.entries[key] = image
+            self.current_bytes += self.image_size(image)
+            # Siempre se conserva la última imagen aunque supere el presupuesto por sí sola
+            while self.current_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= self.image_size(evicted)
+
+    def invalidate(self, path):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == path]:
+                self.current_bytes -= self.image_size(self.entries.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def forget(self, path):
+        # Para fotos borradas o modificadas: fuera de memoria y fuera del disco
+        self.invalidate(path)
+        if self.thumbnail_store:
+            self.thumbnail_store.discard(path, THUMBNAIL_BOX)
+
+    @staticmethod
+    def image_size(image):
+        width, height = image.size
+        return width * height * len(image.getbands())
+
+class TilePyramid:
+    # Pirámide de teselas de cada foto en disco: el nivel 0 es la foto original ya girada y
+    # cada nivel es la mitad del anterior, hasta que cabe en una tesela. Se genera una vez por
+    # foto (se rehace si cambia su tamaño o su fecha) y al ampliar solo se decodifican las
+    # teselas visibles.
+    def __init__(self, directory=TILE_DIR):
+        self.directory = directory
+
+    def folder(self, path):
+        return os.path.join(self.directory, hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest())
+
+    def ensure(self, path):
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        folder = self.folder(path)
+        meta_path = os.path.join(folder, "piramide.json")
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["firma"] == signature:
+                return meta
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        shutil.rmtree(folder, ignore_errors=True)
+        with instrumentation.phase("decodificacion"):
+            with Image.open(path) as image:
+                image = rotate_image(image).convert("RGB")
+        meta = {"firma": signature, "ancho": image.width, "alto": image.height}
+        level = 0
+        while True:
+            os.makedirs(os.path.join(folder, str(level)))
+            for top in range(0, image.height, TILE_SIZE):
+                for left in range(0, image.width, TILE_SIZE):
+                    tile = image.crop((left, top, min(left + TILE_SIZE, image.width), min(top + TILE_SIZE, image.height)))
+                    tile.save(self.tile_path(path, level, left // TILE_SIZE, top // TILE_SIZE), "JPEG", quality=85)
+            level += 1
+            if image.width <= TILE_SIZE and image.height <= TILE_SIZE:
+                break
+            image = image.reduce(2)
+        meta["niveles"] = level
+        # Se escribe al final: una pirámide a medias no se da nunca por buena
+        write_json_atomic(meta_path, meta)
+        return meta
+
+    def tile_path(self, path, level, column, row):
+        return os.path.join(self.folder(path), str(level), f"{column}_{row}.jpg")
+
+    def discard(self, path):
+        shutil.rmtree(self.folder(path), ignore_errors=True)
+
+def image_sort_key(name):
+    # Orden numérico por el primer número del nombre; los nombres sin dígitos van al final
+    match = re.search(r'\d+', name)
+    return (0, int(match.group()), name) if match else (1, 0, name)
+
+class ImageCatalog:
+    # Catálogo de las fotos de la carpeta con su tamaño y orientación EXIF, guardado en
+    # disco. Al volver a explorar solo se leen las cabeceras de los archivos nuevos o
+    # modificados (según fecha y tamaño).
+    def __init__(self, directory=".", path=CATALOG_FILE):
+        self.directory = directory
+        self.path = os.path.join(directory, path)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def scan(self):
+        self.refresh()
+        return sorted(self.entries, key=image_sort_key)
+
+    def changes(self):
+        # Compara la carpeta con la exploración anterior y devuelve los cambios como eventos.
+        # Un archivo que desaparece y otro que aparece con el mismo tamaño y fecha es un renombrado.
+        previous = self.entries
+        self.refresh()
+        current = self.entries
+        removed = {name: entry for name, entry in previous.items() if name not in current}
+        by_signature = {(entry["tamaño"], entry["mtime"]): name for name, entry in removed.items()}
+        events = []
+        for name, entry in current.items():
+            if name not in previous:
+                old_name = by_signature.pop((entry["tamaño"], entry["mtime"]), None)
+                if old_name:
+                    del removed[old_name]
+                    events.append(("renombrada", old_name, name))
+                else:
+                    events.append(("añadida", name))
+            elif entry is not previous[name]:
+                events.append(("modificada", name))
+        events.extend(("borrada", name) for name in removed)
+        return events
+
+    def refresh(self):
+        entries = {}
+        changed = False
+        with os.scandir(self.directory) as iterator:
+            for entry in iterator:
+                if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                cached = self.entries.get(entry.name)
+                if cached and cached["mtime"] == stat.st_mtime_ns and cached["tamaño"] == stat.st_size:
+                    entries[entry.name] = cached
+                else:
+                    entries[entry.name] = self.read_header(entry.path, stat)
+                    changed = True
+        if changed or entries.keys() != self.entries.keys():
+            self.entries = entries
+            write_json_atomic(self.path, entries)
+
+    def read_header(self, path, stat):
+        entry = {"mtime": stat.st_mtime_ns, "tamaño": stat.st_size, "ancho": 0, "alto": 0, "orientación": 1}
+        try:
+            # Image.open solo lee la cabecera; los píxeles no se decodifican
+            with Image.open(path) as image:
+                entry["ancho"], entry["alto"] = image.size
+                entry["orientación"] = image.getexif().get(274, 1)
+        except OSError:
+            pass
+        return entry
+
+    def display_size(self, name, height):
+        entry = self.entries.get(name)
+        if not entry or not entry["alto"]:
+            return None
+        width, original_height = entry["ancho"], entry["alto"]
+        if entry["orientación"] in (6, 8):
+            width, original_height = original_height, width
+        return int(width * (height / original_height)), height
+
+class ImagePrefetcher:
+    # Decodifica y redimensiona fotos en hilos de trabajo; el hilo de Tk solo crea el PhotoImage
+    def __init__(self, image_cache, workers=2):
+        self.image_cache = image_cache
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="precarga")
+        self.futures = {}
+
+    def request(self, path, height):
+        key = (path, height)
+        future = self.futures.get(key)
+        # Una tarea terminada no se reutiliza: si falló, se vuelve a intentar
+        if future is None or future.done():
+            future = self.executor.submit(self.image_cache.get, path, height=height)
+            self.futures[key] = future
+        return future
+
+    def prefetch(self, paths, height):
+        self.cancel(keep={(path, height) for path in paths})
+        for path in paths:
+            if self.image_cache.peek(path, height=height) is None:
+                self.request(path, height)
+
+    def cancel(self, keep=()):
+        # Las tareas que ya se están ejecutando no se pueden cancelar; se dejan terminar
+        # para que su resultado acabe en la caché
+        for key, future in list(self.futures.items()):
+            if key not in keep:
+                future.cancel()
+            if future.done():
+                del self.futures[key]
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 class CustomDialog(simpledialog.Dialog):
     def __init__(self, parent, title, prompt):
@@ -50,80 +394,328 @@ class CustomDialog(simpledialog.Dialog):
         self.result = self.entry.get()
 
 class ImageSelectionDialog(tk.Toplevel):
-    def __init__(self, parent, images):
+    COLUMNS = 3
+    CELL_SIZE = THUMBNAIL_BOX[0] + 20
+
+    def __init__(self, parent, images, image_cache):
         super().__init__(parent)
         self.title("Seleccionar Imagen")
         self.geometry("800x600")
         self.images = images
+        self.image_cache = image_cache
         self.selected_image = None
+        # Solo existen elementos del canvas para las filas visibles; el resto se crea al desplazarse
+        self.cells = {}
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="miniaturas")
+        self.render_scheduled = False
+        self.polling = False
         self.create_widgets()
+        self.bind('<Destroy>', self.on_destroy)
 
     def create_widgets(self):
         self.canvas = tk.Canvas(self)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.canvas.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-        self.canvas.bind('<Configure>', lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-
-        self.frame = tk.Frame(self.canvas)
-        self.canvas.create_window((0, 0), window=self.frame, anchor="nw")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        rows = (len(self.images) + self.COLUMNS - 1) // self.COLUMNS
+        self.canvas.configure(yscrollcommand=self.on_scroll,
+                              scrollregion=(0, 0, self.COLUMNS * self.CELL_SIZE, rows * self.CELL_SIZE))
+        self.canvas.bind('<Configure>', lambda e: self.schedule_render())
+        self.canvas.bind('<MouseWheel>', lambda e: self.canvas.yview_scroll(int(-e.delta / 120), "units"))
+        self.canvas.bind('<Button-4>', lambda e: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind('<Button-5>', lambda e: self.canvas.yview_scroll(1, "units"))
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_render()
+
+    def schedule_render(self):
+        # Agrupa los eventos de desplazamiento seguidos en un solo repintado
+        if not self.render_scheduled:
+            self.render_scheduled = True
+            self.after_idle(self.render_visible)
+
+    def render_visible(self):
+        self.render_scheduled = False
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        # Se mantiene una fila extra por arriba y por abajo para que el desplazamiento sea suave
+        first_row = max(0, int(top // self.CELL_SIZE) - 1)
+        last_row = int(bottom // self.CELL_SIZE) + 1
+        visible = range(first_row * self.COLUMNS, min(len(self.images), (last_row + 1) * self.COLUMNS))
+
+        for index in list(self.cells):
+            if index not in visible:
+                self.canvas.delete(f"celda{index}")
+                del self.cells[index]
+                future = self.pending.pop(index, None)
+                if future:
+                    future.cancel()
+
+        for index in visible:
+            if index not in self.cells:
+                self.create_cell(index)
+
+        if self.pending and not self.polling:
+            self.polling = True
+            self.after(IMAGE_POLL_MS, self.poll_thumbnails)
+
+    def create_cell(self, index):
+        img_path = self.images[index]
+        tag = f"celda{index}"
+        x = (index % self.COLUMNS) * self.CELL_SIZE + self.CELL_SIZE // 2
+        y = (index // self.COLUMNS) * self.CELL_SIZE + self.CELL_SIZE // 2
+        image = self.image_cache.peek(img_path, box=THUMBNAIL_BOX)
+        if image is not None:
+            self.cells[index] = ImageTk.PhotoImage(image)
+            self.canvas.create_image(x, y, image=self.cells[index], tags=tag)
+        else:
+            self.cells[index] = None
+            self.canvas.create_text(x, y, text="Cargando...", font=('calibri', 14), tags=tag)
+            self.pending[index] = self.executor.submit(self.image_cache.get, img_path, box=THUMBNAIL_BOX)
+        self.canvas.tag_bind(tag, '<Button-1>', lambda e, x=img_path: self.select_image(x))
 
-        for i, img_path in enumerate(self.images):
-            img = Image.open(img_path)
-            img = self.rotate_image(img)
-            img.thumbnail((400, 400))  # Resize image to fit in a 300x300 box
-            photo = ImageTk.PhotoImage(img)
-            btn = ttk.Button(self.frame, image=photo, command=lambda x=img_path: self.select_image(x))
-            btn.image = photo
-            btn.grid(row=i//3, column=i%3, padx=10, pady=10)
+    def poll_thumbnails(self):
+        if not self.winfo_exists():
+            return
+        for index, future in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[index]
+            if index not in self.cells or future.cancelled() or future.exception():
+                continue
+            tag = f"celda{index}"
+            x, y = self.canvas.coords(tag)
+            self.canvas.delete(tag)
+            self.cells[index] = ImageTk.PhotoImage(future.result())
+            self.canvas.create_image(x, y, image=self.cells[index], tags=tag)
+        if self.pending:
+            self.after(IMAGE_POLL_MS, self.poll_thumbnails)
+        else:
+            self.polling = False
 
-    def rotate_image(self, image):
-        try:
-            exif = image._getexif()
-            if exif:
-                orientation = exif.get(274, 1)  # 274 is the orientation tag
-                if orientation == 3:
-                    return image.rotate(180, expand=True)
-                elif orientation == 6:
-                    return image.rotate(270, expand=True)
-                elif orientation == 8:
-                    return image.rotate(90, expand=True)
-        except (AttributeError, KeyError, IndexError):
-            # No EXIF data or orientation not found, proceed without rotation
-            pass
-        return image
+    def on_destroy(self, event):
+        if event.widget is self:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            if self.image_cache.thumbnail_store:
+                self.image_cache.thumbnail_store.flush()
 
     def select_image(self, img_path):
         self.selected_image = img_path
         self.destroy()
 
+class ToolListView:
+    # Listbox de herramientas que solo aplica las diferencias con lo que ya se muestra.
+    # Las filas son pares (número, texto) ordenados por número. Con muchas filas la lista
+    # se virtualiza: el Listbox solo contiene las visibles y la barra de desplazamiento
+    # mueve la ventana sobre self.rows.
+    def __init__(self, parent, virtual_threshold=VIRTUAL_LIST_THRESHOLD, **options):
+        self.virtual_threshold = virtual_threshold
+        self.rows = []
+        self.shown = []
+        self.offset = 0
+        self.virtual = False
+        self.selected = None
+        self.line_height = font.Font(font=options.get('font')).metrics('linespace') + 2
+
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.listbox = tk.Listbox(parent, yscrollcommand=self.on_listbox_scroll, **options)
+        self.listbox.bind('<<ListboxSelect>>', self.on_select, add=True)
+        self.listbox.bind('<Configure>', lambda e: self.render())
+        self.listbox.bind('<MouseWheel>', lambda e: self.on_wheel(-3 if e.delta > 0 else 3))
+        self.listbox.bind('<Button-4>', lambda e: self.on_wheel(-3))
+        self.listbox.bind('<Button-5>', lambda e: self.on_wheel(3))
+
+    def pack(self, **options):
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.pack(side=tk.LEFT, **options)
+
+    def bind(self, sequence, func):
+        self.listbox.bind(sequence, func, add=True)
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.render()
+
+    def selected_number(self):
+        selection = self.listbox.curselection()
+        if selection:
+            return self.shown[selection[0]][0]
+        return None
+
+    def visible_count(self):
+        height = self.listbox.winfo_height()
+        if height <= 1:
+            return int(self.listbox['height'])
+        return max(1, height // self.line_height)
+
+    def render(self):
+        self.virtual = len(self.rows) > self.virtual_threshold
+        if self.virtual:
+            count = self.visible_count()
+            self.offset = max(0, min(self.offset, len(self.rows) - count))
+            self.apply_rows(self.rows[self.offset:self.offset + count])
+            self.listbox.yview_moveto(0)
+            self.update_scrollbar()
+        else:
+            self.offset = 0
+            self.apply_rows(self.rows)
+        self.restore_selection()
+
+    def apply_rows(self, rows):
+        # Mezcla de dos listas ordenadas por número: solo se borran las filas que sobran y
+        # se insertan las que faltan, agrupando las operaciones contiguas
+        listbox = self.listbox
+        old = self.shown
+        position = i = j = 0
+        pending_delete = 0
+        pending_insert = []
+
+        def flush():
+            nonlocal position, pending_delete, pending_insert
+            if pending_delete:
+                listbox.delete(position, position + pending_delete - 1)
+                pending_delete = 0
+            if pending_insert:
+                listbox.insert(position, *pending_insert)
+                position += len(pending_insert)
+                pending_insert = []
+
+        while i < len(old) or j < len(rows):
+            if j == len(rows) or (i < len(old) and old[i][0] < rows[j][0]):
+                if pending_insert:
+                    flush()
+                pending_delete += 1
+                i += 1
+            elif i == len(old) or rows[j][0] < old[i][0]:
+                if pending_delete:
+                    flush()
+                pending_insert.append(rows[j][1])
+                j += 1
+            else:
+                flush()
+                if old[i][1] != rows[j][1]:
+                    listbox.delete(position)
+                    listbox.insert(position, rows[j][1])
+                position += 1
+                i += 1
+                j += 1
+        flush()
+        self.shown = rows
+
+    def restore_selection(self):
+        if self.selected is None:
+            return
+        current = self.selected_number()
+        if current == self.selected:
+            return
+        self.listbox.selection_clear(0, tk.END)
+        for index, (number, text) in enumerate(self.shown):
+            if number == self.selected:
+                self.listbox.selection_set(index)
+                break
+
+    def on_select(self, event):
+        number = self.selected_number()
+        if number is not None:
+            self.selected = number
+
+    def on_listbox_scroll(self, first, last):
+        if not self.virtual:
+            self.scrollbar.set(first, last)
+
+    def update_scrollbar(self):
+        total = len(self.rows)
+        self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(self.shown)) / total))
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.rows) - self.visible_count()))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def on_scrollbar(self, action, *args):
+        if not self.virtual:
+            self.listbox.yview(action, *args)
+        elif action == "moveto":
+            self.scroll_to(int(float(args[0]) * len(self.rows)))
+        else:
+            step = self.visible_count() if args[1] == "pages" else 1
+            self.scroll_to(self.offset + int(args[0]) * step)
+
+    def on_wheel(self, units):
+        if self.virtual:
+            self.scroll_to(self.offset + units)
+            return "break"
+
 class MainApplication:
     def __init__(self, root):
         self.root = root
         self.root.title("Inventario de Herramientas")
         self.root.state('zoomed')  # Para Windows
 
-        self.inventory = []
+        if SERVER_ADDRESS:
+            # Varios puestos: el inventario lo guarda el servidor y aquí se tiene una copia
+            self.manager = RemoteInventoryManager(SERVER_ADDRESS)
+        else:
+            # Con la instrumentación activa, cada llamada al almacenamiento cuenta como E/S
+            self.manager = InventoryManager(instrumentation.wrap_object(create_storage(), "io"))
         self.current_tool = None
-        self.locations = []
-        self.location_images = {}
 
         # Configura un estilo global con una fuente más pequeña para la lista desplegable
         self.root.option_add('*TCombobox*Listbox*Font', 'Arial 16')
 
         self.canvas = None
         self.image_reference = None
+        self.image_cache = ImageCache(thumbnail_store=ThumbnailStore())
+        self.prefetcher = ImagePrefetcher(self.image_cache)
+        self.catalog = ImageCatalog()
+        self.display_token = 0
         self.current_page = 0
         self.images = []
 
+        # Ampliación: zoom es None en la vista normal (ajustada a IMAGE_HEIGHT); si no, la escala
+        # respecto a la foto original, y zoom_origin la esquina visible en píxeles de la original
+        self.pyramid = TilePyramid()
+        self.displayed_path = None
+        self.pyramid_meta = None
+        # Pirámides en preparación por foto: dos preparaciones de la misma foto a la vez se
+        # pisarían los archivos, así que una petición nueva espera a la que ya está en marcha
+        self.pyramid_futures = {}
+        self.pending_zoom = None
+        self.zoom = None
+        self.zoom_origin = (0.0, 0.0)
+        self.tile_photos = {}
+        self.tile_futures = {}
+        self.tiles_polling = False
+        self.pan_start = None
+        self.background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="segundo_plano")
+
+        # Búsqueda en vivo: se hace en un hilo aparte
+        self.search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="busqueda")
+        self.search_future = None
+        self.search_after_id = None
+        self.search_token = 0
+        self.live_results = []
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Se envuelven antes de crear los widgets para que los botones usen la versión medida
+        for name in INSTRUMENTED_HANDLERS:
+            setattr(self, name, instrumentation.wrap(name, getattr(self, name)))
+
+        # La ventana se muestra enseguida; el inventario y las fotos se cargan en segundo plano
         self.create_widgets()
-        self.load_inventory()
-        self.load_locations()
-        self.load_location_images()
-        self.load_images()
+        self.set_loading(True)
+        self.run_in_background(self.manager.load, self.finish_load_data)
+        self.run_in_background(self.catalog.scan, self.finish_load_images)
+
+    @property
+    def inventory(self):
+        return self.manager.inventory
 
     def create_widgets(self):
         self.root.grid_columnconfigure(0, weight=1)
@@ -135,10 +727,24 @@ class MainApplication:
         left_frame.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
         self.canvas = tk.Canvas(left_frame, width=400, height=400)  # Reducir el tamaño del canvas
         self.canvas.pack(expand=True, fill=tk.BOTH)
+        # Rueda para ampliar, arrastrar para moverse y doble clic para volver a la vista normal
+        self.canvas.bind('<MouseWheel>', lambda e: self.zoom_image(ZOOM_STEP if e.delta > 0 else 1 / ZOOM_STEP, e.x, e.y))
+        self.canvas.bind('<Button-4>', lambda e: self.zoom_image(ZOOM_STEP, e.x, e.y))
+        self.canvas.bind('<Button-5>', lambda e: self.zoom_image(1 / ZOOM_STEP, e.x, e.y))
+        self.canvas.bind('<ButtonPress-1>', lambda e: setattr(self, "pan_start", (e.x, e.y)))
+        self.canvas.bind('<B1-Motion>', self.pan_image)
+        self.canvas.bind('<Double-1>', lambda e: self.reset_zoom())
 
         middle_frame = ttk.Frame(self.root)
         middle_frame.grid(row=0, column=1, sticky="nsew", padx=10, pady=10)
-        self.tool_list = tk.Listbox(middle_frame, font=('calibri', 18))
+        ttk.Label(middle_frame, text="Búsqueda rápida:", font=('calibri', 14)).pack(anchor=tk.W)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", self.on_search_changed)
+        ttk.Entry(middle_frame, textvariable=self.search_var, font=('calibri', 18)).pack(fill=tk.X, pady=(0, 5))
+        self.search_results = tk.Listbox(middle_frame, font=('calibri', 14), height=6, exportselection=False)
+        self.search_results.pack(fill=tk.X, pady=(0, 10))
+        self.search_results.bind('<<ListboxSelect>>', self.on_search_result_select)
+        self.tool_list = ToolListView(middle_frame, font=('calibri', 18))
         self.tool_list.pack(expand=True, fill=tk.BOTH)
         self.tool_list.bind('<<ListboxSelect>>', self.on_tool_select)
 
@@ -152,7 +758,7 @@ class MainApplication:
         ttk.Button(nav_frame, text="Siguiente", command=self.next_image, style='Large.TButton').pack(side=tk.RIGHT, padx=5)
 
     def create_right_panel(self, parent):
-        right_panel = ttk.Frame(parent)
+        right_panel = self.right_panel = ttk.Frame(parent)
         right_panel.pack(side=tk.RIGHT, fill=tk.Y, padx=10, pady=10)
 
         self.number_var = tk.StringVar()
@@ -166,7 +772,7 @@ class MainApplication:
         ttk.Entry(right_panel, textvariable=self.name_var, font=large_font).grid(row=1, column=1, padx=5, pady=5, sticky="ew")
         ttk.Label(right_panel, text="Ubicación:", font=large_font).grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
         
-        sorted_locations = sorted(self.locations, key=lambda x: int(x))
+        sorted_locations = sorted(self.manager.locations, key=lambda x: int(x))
         self.location_combobox = ttk.Combobox(right_panel, textvariable=self.location_var, font=large_font, values=sorted_locations, height=10, state="readonly")
         self.location_combobox.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
         self.location_combobox.configure(style='Large.TCombobox')
@@ -186,6 +792,7 @@ class MainApplication:
         ttk.Button(right_panel, text="Buscar Herramienta", command=self.find_tool, style='Large.TButton').grid(row=8, column=0, columnspan=2, pady=10, sticky="ew")
         ttk.Button(right_panel, text="Añadir Ubicación", command=self.add_location, style='Large.TButton').grid(row=9, column=0, columnspan=2, pady=10, sticky="ew")
         ttk.Button(right_panel, text="Limpiar", command=self.clear_entries, style='Large.TButton').grid(row=10, column=0, columnspan=2, pady=10, sticky="ew")
+        ttk.Button(right_panel, text="Préstamos", command=self.show_loans, style='Large.TButton').grid(row=11, column=0, columnspan=2, pady=10, sticky="ew")
         right_panel.grid_columnconfigure(1, weight=1)
 
     def add_or_update_tool(self):
@@ -193,102 +800,143 @@ class MainApplication:
             name = self.name_var.get()
             location = self.location_var.get()
             
-            if not name or not location:
-                raise ValueError("Nombre y ubicación no pueden estar vacíos")
-            
             if self.current_tool:
-                self.current_tool.name = name
-                self.current_tool.location = location
+                self.manager.update_tool(self.current_tool, name, location)
             else:
-                number = self.get_next_available_number()
-                tool = GardenTool(number, name, location)
-                self.inventory.append(tool)
+                self.manager.add_tool(name, location)
             
-            self.save_inventory()
             self.clear_entries()
             self.update_tool_list()
         except ValueError as e:
-            messagebox.showerror("Error", str(e))
+            with instrumentation.phase("espera_usuario"):
+                messagebox.showerror("Error", str(e))
 
     def delete_tool(self):
-        selected = self.tool_list.curselection()
-        if selected:
-            index = selected[0]
-            tool_str = self.tool_list.get(index)
-            tool_number = int(tool_str.split(":")[0])
-            tool = next((t for t in self.inventory if t.number == tool_number), None)
+        tool_number = self.tool_list.selected_number()
+        if tool_number is not None:
+            tool = self.inventory.get(tool_number)
             if tool:
-                confirm = messagebox.askyesno("Confirmar Borrado", f"Estás seguro de que quieres borrar la herramienta {tool.number}: {tool.name}?")
+                with instrumentation.phase("espera_usuario"):
+                    confirm = messagebox.askyesno("Confirmar Borrado", f"Estás seguro de que quieres borrar la herramienta {tool.number}: {tool.name}?")
                 if confirm:
-                    self.inventory.remove(tool)
-                    self.save_inventory()
+                    try:
+                        self.manager.delete_tool(tool)
+                    except ValueError as e:
+                        with instrumentation.phase("espera_usuario"):
+                            messagebox.showerror("Error", str(e))
                     self.clear_entries()
                     self.update_tool_list()
             else:
-                messagebox.showwarning("Advertencia", "No se pudo encontrar la herramienta seleccionada")
+                with instrumentation.phase("espera_usuario"):
+                    messagebox.showwarning("Advertencia", "No se pudo encontrar la herramienta seleccionada")
         else:
-            messagebox.showwarning("Advertencia", "Por favor, selecciona una herramienta para borrar")
-
-    def get_next_available_number(self):
-        used_numbers = set(tool.number for tool in self.inventory)
-        for i in range(1, len(self.inventory) + 2):
-            if i not in used_numbers:
-                return i
+            with instrumentation.phase("espera_usuario"):
+                messagebox.showwarning("Advertencia", "Por favor, selecciona una herramienta para borrar")
 
     def lend_tool(self):
         if self.current_tool:
             borrower = self.borrower_var.get()
             if borrower:
-                self.current_tool.borrowed_by = borrower
-                self.save_inventory()
+                try:
+                    self.manager.lend_tool(self.current_tool, borrower)
+                except ValueError as e:
+                    # Con servidor: otro puesto la cambió antes; se muestra cómo está ahora
+                    with instrumentation.phase("espera_usuario"):
+                        messagebox.showerror("Error", str(e))
+                    self.refresh_selected_tool()
             else:
-                messagebox.showwarning("Advertencia", "Por favor, introduce el nombre de la persona que se lleva la herramienta")
+                with instrumentation.phase("espera_usuario"):
+                    messagebox.showwarning("Advertencia", "Por favor, introduce el nombre de la persona que se lleva la herramienta")
         else:
-            messagebox.showwarning("Advertencia", "Por favor, selecciona una herramienta")
+            with instrumentation.phase("espera_usuario"):
+                messagebox.showwarning("Advertencia", "Por favor, selecciona una herramienta")
 
     def return_tool(self):
         if self.current_tool:
-            self.current_tool.borrowed_by = None
-            self.borrower_var.set("")
-            self.save_inventory()
+            try:
+                self.manager.return_tool(self.current_tool)
+                self.borrower_var.set("")
+            except ValueError as e:
+                with instrumentation.phase("espera_usuario"):
+                    messagebox.showerror("Error", str(e))
+                self.refresh_selected_tool()
         else:
-            messagebox.showwarning("Advertencia", "Por favor, selecciona una herramienta")
+            with instrumentation.phase("espera_usuario"):
+                messagebox.showwarning("Advertencia", "Por favor, selecciona una herramienta")
 
     def find_tool(self):
-        dialog = CustomDialog(self.root, "Buscar Herramienta", "Introduce el nombre o el número de la herramienta:")
+        with instrumentation.phase("espera_usuario"):
+            dialog = CustomDialog(self.root, "Buscar Herramienta", "Introduce el nombre o el número de la herramienta:")
         search_term = dialog.result
         if search_term:
-            # Búsqueda por coincidencia parcial
-            partial_matches = [tool for tool in self.inventory if search_term.lower() in tool.name.lower()]
-            
-            # Búsqueda por número exacto
-            number_match = next((tool for tool in self.inventory if str(tool.number) == search_term), None)
-            
-            if number_match:
-                partial_matches.insert(0, number_match)
-            
-            if partial_matches:
-                if len(partial_matches) == 1:
-                    self.select_tool(partial_matches[0])
-                    self.update_location_image()
-                    self.update_tool_list()
-                else:
-                    self.show_multiple_matches(partial_matches)
-                return
+            # Número exacto y coincidencias parciales; si no hay, por similitud (ya vienen ordenadas)
+            matches, similar = self.manager.find(search_term)
 
-            # Si no hay coincidencias parciales, buscar por similitud
-            similar_matches = []
-            for tool in self.inventory:
-                ratio = difflib.SequenceMatcher(None, search_term.lower(), tool.name.lower()).ratio()
-                if ratio > 0.5:  # Ajusta este umbral según sea necesario
-                    similar_matches.append((tool, ratio))
+            if len(matches) == 1 and not similar:
+                self.select_tool(matches[0])
+                self.update_location_image()
+                self.update_tool_list()
+                return
 
-            if similar_matches:
-                similar_matches.sort(key=lambda x: x[1], reverse=True)
-                self.show_multiple_matches([match[0] for match in similar_matches])
+            if matches:
+                self.show_multiple_matches(matches)
                 return
 
-            messagebox.showinfo("Herramienta no encontrada", f"No se ha encontrado ninguna herramienta similar a: {search_term}")
+            with instrumentation.phase("espera_usuario"):
+                messagebox.showinfo("Herramienta no encontrada", f"No se ha encontrado ninguna herramienta similar a: {search_term}")
+
+    def on_search_changed(self, *args):
+        # Se espera a que el usuario deje de escribir antes de buscar
+        if self.search_after_id:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.run_live_search)
+
+    def run_live_search(self):
+        self.search_after_id = None
+        self.search_token += 1
+        search_term = self.search_var.get().strip()
+        if not search_term:
+            self.show_search_results([])
+            return
+
+        # Ninguna búsqueda recorre el inventario en el hilo de Tk (con una o dos letras la
+        # parcial lo revisa entero); la anterior se cancela si aún no ha empezado
+        if self.search_future:
+            self.search_future.cancel()
+        self.search_future = self.search_executor.submit(self.live_search, search_term, self.search_token)
+        self.root.after(IMAGE_POLL_MS, self.finish_live_search, self.search_future, self.search_token)
+
+    def live_search(self, search_term, token):
+        # En el hilo de búsqueda: parcial y por número; si no hay nada, por similitud, salvo
+        # que mientras tanto se haya escrito otra cosa
+        matches = self.inventory.search_index.substring(search_term)
+        number_match = self.inventory.get(int(search_term)) if search_term.isdecimal() else None
+        if number_match and number_match not in matches:
+            matches.insert(0, number_match)
+        if matches or token != self.search_token:
+            return matches
+        return [tool for tool, score in self.inventory.search_index.search(search_term)]
+
+    def finish_live_search(self, future, token):
+        if token != self.search_token:
+            return
+        if not future.done():
+            self.root.after(IMAGE_POLL_MS, self.finish_live_search, future, token)
+            return
+        self.show_search_results(future.result())
+
+    def show_search_results(self, tools):
+        self.live_results = tools[:LIVE_SEARCH_LIMIT]
+        self.search_results.delete(0, tk.END)
+        for tool in self.live_results:
+            self.search_results.insert(tk.END, f"{tool.number}: {tool.name}")
+
+    def on_search_result_select(self, event):
+        selection = self.search_results.curselection()
+        if selection:
+            self.select_tool(self.live_results[selection[0]])
+            self.update_location_image()
+            self.update_tool_list()
 
     def show_multiple_matches(self, matches):
         dialog = tk.Toplevel(self.root)
@@ -321,6 +969,81 @@ class MainApplication:
 
         dialog.bind('<Return>', on_select)
         
+    def show_loans(self):
+        # Lo que tiene cada persona y lo que lleva fuera demasiado tiempo; las consultas usan
+        # los índices del historial de préstamos, no recorren el inventario
+        try:
+            names = self.manager.borrowers()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Préstamos")
+        dialog.geometry("600x500")
+
+        top = ttk.Frame(dialog)
+        top.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Label(top, text="Persona:", font=('calibri', 14)).pack(side=tk.LEFT)
+        borrower_var = tk.StringVar()
+        borrowers = ttk.Combobox(top, textvariable=borrower_var, values=names,
+                                 font=('calibri', 14), state="readonly")
+        borrowers.pack(side=tk.LEFT, padx=5)
+        days_var = tk.IntVar(value=OVERDUE_DAYS)
+        ttk.Spinbox(top, from_=1, to=365, textvariable=days_var, width=4, font=('calibri', 14)).pack(side=tk.RIGHT)
+        ttk.Label(top, text="Fuera más de (días):", font=('calibri', 14)).pack(side=tk.RIGHT, padx=5)
+
+        listbox = tk.Listbox(dialog, font=('calibri', 14))
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        numbers = []
+
+        def describe(loan, show_borrower=False):
+            tool = self.inventory.get(loan.number)
+            text = f"{loan.number}: {tool.name if tool else '(borrada)'}"
+            if show_borrower:
+                text += f" — {loan.borrower}"
+            if loan.since is None:
+                return text + " — desde fecha desconocida"
+            text += f" — desde {loan.since:%d/%m/%Y %H:%M}"
+            if loan.returned:
+                return text + f" hasta {loan.returned:%d/%m/%Y %H:%M}"
+            return text + f" ({(datetime.now() - loan.since).days} días)"
+
+        def show(lines):
+            listbox.delete(0, tk.END)
+            numbers.clear()
+            for number, text in lines:
+                listbox.insert(tk.END, text)
+                numbers.append(number)
+
+        def on_borrower(event=None):
+            loans, history = self.manager.loans_of(borrower_var.get())
+            lines = [(loan.number, describe(loan)) for loan in loans]
+            if history:
+                lines.append((None, "Devueltas últimamente:"))
+                lines.extend((loan.number, describe(loan)) for loan in history)
+            show(lines)
+
+        def on_overdue():
+            try:
+                days = days_var.get()
+            except tk.TclError:
+                return
+            show([(loan.number, describe(loan, show_borrower=True)) for loan in self.manager.overdue_loans(days)])
+
+        def on_select(event=None):
+            selection = listbox.curselection()
+            tool = self.inventory.get(numbers[selection[0]]) if selection and numbers[selection[0]] else None
+            if tool:
+                self.select_tool(tool)
+                self.update_location_image()
+                self.update_tool_list()
+
+        borrowers.bind('<<ComboboxSelected>>', on_borrower)
+        ttk.Button(top, text="Atrasados", command=on_overdue).pack(side=tk.RIGHT, padx=5)
+        listbox.bind('<Double-1>', on_select)
+        listbox.bind('<Return>', on_select)
+        on_overdue()
+
     def select_tool(self, tool):
         self.current_tool = tool
         self.number_var.set(str(tool.number))
@@ -328,6 +1051,13 @@ class MainApplication:
         self.location_var.set(tool.location)
         self.borrower_var.set(tool.borrowed_by if tool.borrowed_by else "")
 
+    def refresh_selected_tool(self):
+        # La copia local se actualiza en el sitio; si la herramienta se borró en otro puesto, se limpia
+        if self.current_tool and self.inventory.get(self.current_tool.number) is self.current_tool:
+            self.select_tool(self.current_tool)
+        else:
+            self.clear_entries()
+
     def clear_entries(self):
         self.current_tool = None
         self.number_var.set("")
@@ -335,102 +1065,342 @@ class MainApplication:
         self.location_var.set("")
         self.borrower_var.set("")
 
-    def save_inventory(self):
-        with open("inventory.json", "w") as f:
-            json.dump([tool.to_dict() for tool in self.inventory], f)
+    def run_in_background(self, function, callback):
+        future = self.background.submit(function)
 
-    def load_inventory(self):
+        def check():
+            if future.done():
+                callback(future)
+            else:
+                self.root.after(IMAGE_POLL_MS, check)
+        self.root.after(IMAGE_POLL_MS, check)
+        return future
+
+    def set_loading(self, loading):
+        # Mientras se carga el inventario no se permite modificarlo
+        self.root.title("Inventario de Herramientas" + (" (cargando...)" if loading else ""))
+        for widget in self.right_panel.winfo_children():
+            if isinstance(widget, ttk.Button):
+                widget.state(["disabled"] if loading else ["!disabled"])
+
+    def finish_load_data(self, future):
         try:
-            with open("inventory.json", "r") as f:
-                data = json.load(f)
-                self.inventory = [GardenTool.from_dict(item) for item in data]
-        except FileNotFoundError:
-            self.inventory = []
+            future.result()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"No se pudo cargar el inventario: {e}")
+            return
+        sorted_locations = sorted(self.manager.locations, key=lambda x: int(x))
+        self.location_combobox['values'] = sorted_locations
+        self.set_loading(False)
+        self.update_tool_list()
+        if isinstance(self.manager, RemoteInventoryManager):
+            self.root.after(SYNC_INTERVAL_MS, self.sync_inventory)
+
+    def sync_inventory(self):
+        self.run_in_background(self.manager.fetch_changes, self.finish_sync_inventory)
+
+    def finish_sync_inventory(self, future):
+        try:
+            changed = self.manager.apply_changes(future.result())
+        except ValueError:
+            # Servidor no disponible: se vuelve a intentar en la próxima vuelta
+            changed = False
+        if changed:
+            self.location_combobox['values'] = sorted(self.manager.locations, key=lambda x: int(x))
+            self.update_tool_list()
+        self.root.after(SYNC_INTERVAL_MS, self.sync_inventory)
 
     def add_location(self):
         dialog = CustomDialog(self.root, "Añadir Ubicación", "Introduce el nombre de la nueva ubicación:")
         new_location = dialog.result
-        if new_location and new_location not in self.locations:
-            self.locations.append(new_location)
-            sorted_locations = sorted(self.locations, key=lambda x: int(x))
+        if self.manager.add_location(new_location):
+            sorted_locations = sorted(self.manager.locations, key=lambda x: int(x))
             self.location_combobox['values'] = sorted_locations
-            self.save_locations()
             self.link_image_to_location(new_location)
 
-    def save_locations(self):
-        with open("locations.json", "w") as f:
-            json.dump(self.locations, f)
-
-    def load_locations(self):   
-        try:
-            with open("locations.json", "r") as f:
-                self.locations = json.load(f)
-            sorted_locations = sorted(self.locations, key=lambda x: int(x))
-            self.location_combobox['values'] = sorted_locations
-        except FileNotFoundError:
-            self.locations = []
-
     def link_image_to_location(self, location):
         if not self.images:
             messagebox.showwarning("Advertencia", "No hay imágenes disponibles para enlazar.")
             return
 
-        dialog = ImageSelectionDialog(self.root, self.images)
+        # Copia, para que el vigilante de la carpeta no mueva las fotos mientras se elige
+        dialog = ImageSelectionDialog(self.root, list(self.images), self.image_cache)
         self.root.wait_window(dialog)
         
         if dialog.selected_image:
-            self.location_images[location] = dialog.selected_image
-            self.save_location_images()
+            self.manager.set_location_image(location, dialog.selected_image)
         else:
             messagebox.showwarning("Advertencia", "No se seleccionó ninguna imagen.")
 
-    def save_location_images(self):
-        with open("location_images.json", "w") as f:
-            json.dump(self.location_images, f)
-
-    def load_location_images(self):
+    def finish_load_images(self, future):
         try:
-            with open("location_images.json", "r") as f:
-                self.location_images = json.load(f)
-        except FileNotFoundError:
-            self.location_images = {}
-
-    def load_images(self):
-        self.images = [f for f in os.listdir() if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-        # Ordenar las imágenes numéricamente
-        self.images.sort(key=lambda x: int(re.search(r'\d+', x).group()))
+            self.images = future.result()
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudieron leer las imágenes: {e}")
+            return
         if self.images:
             self.show_current_image()
+        self.root.after(WATCH_INTERVAL_MS, self.watch_images)
 
-    def show_current_image(self):
-        if self.images:
-            image = Image.open(self.images[self.current_page])
-            
-            # Rotate image based on EXIF data
+    def watch_images(self):
+        self.run_in_background(self.catalog.changes, self.apply_image_changes)
+
+    def apply_image_changes(self, future):
+        # Pase lo que pase con estos cambios, se sigue vigilando la carpeta
+        try:
             try:
-                exif = image._getexif()
-                if exif:
-                    orientation = exif.get(274, 1)  # 274 is the orientation tag
-                    if orientation == 3:
-                        image = image.rotate(180, expand=True)
-                    elif orientation == 6:
-                        image = image.rotate(270, expand=True)
-                    elif orientation == 8:
-                        image = image.rotate(90, expand=True)
-            except (AttributeError, KeyError, IndexError):
-                # No EXIF data or orientation not found, proceed without rotation
-                pass
+                events = future.result()
+            except OSError:
+                events = []
+            current_image = self.images[self.current_page] if self.images else None
+            failed = []
+            for event in events:
+                kind, name = event[0], event[1]
+                if kind == "añadida":
+                    self.insert_image(name)
+                elif kind == "borrada":
+                    self.remove_image(name)
+                    self.image_cache.forget(name)
+                    self.background.submit(self.pyramid.discard, name)
+                elif kind == "modificada":
+                    self.image_cache.forget(name)
+                elif kind == "renombrada":
+                    new_name = event[2]
+                    self.remove_image(name)
+                    self.insert_image(new_name)
+                    self.image_cache.forget(name)
+                    self.background.submit(self.pyramid.discard, name)
+                    for location in list(self.inventory.image_locations.get(name, ())):
+                        try:
+                            self.manager.set_location_image(location, new_name)
+                        except (ValueError, OSError) as e:
+                            failed.append(f"{location}: {e}")
+                    if current_image == name:
+                        current_image = new_name
+            if events:
+                # Se sigue mostrando la misma foto si todavía existe
+                index = self.find_image(current_image) if current_image else None
+                if index is not None:
+                    self.current_page = index
+                else:
+                    self.current_page = min(self.current_page, max(0, len(self.images) - 1))
+                changed = {event[-1] for event in events} | {event[1] for event in events}
+                if not self.images:
+                    self.display_token += 1
+                    self.canvas.delete("all")
+                    self.update_tool_list()
+                elif self.images[self.current_page] in changed or index is None:
+                    self.show_current_image()
+                else:
+                    self.prefetch_neighbours()
+            if failed:
+                messagebox.showwarning("Advertencia", "No se pudo actualizar la foto de estas ubicaciones tras renombrarla:\n"
+                                       + "\n".join(failed))
+        finally:
+            self.root.after(WATCH_INTERVAL_MS, self.watch_images)
+
+    def find_image(self, name):
+        # self.images está ordenada por image_sort_key: búsqueda binaria en lugar de index()
+        index = bisect.bisect_left(self.images, image_sort_key(name), key=image_sort_key)
+        if index < len(self.images) and self.images[index] == name:
+            return index
+        return None
+
+    def insert_image(self, name):
+        bisect.insort(self.images, name, key=image_sort_key)
+
+    def remove_image(self, name):
+        index = self.find_image(name)
+        if index is not None:
+            del self.images[index]
 
-            width, height = image.size
-            new_height = 800  # Reducir la altura máxima de la imagen
-            new_width = int(width * (new_height / height))
-            image = image.resize((new_width, new_height), Image.LANCZOS)
-            self.image_reference = ImageTk.PhotoImage(image)
-            self.canvas.delete("all")
-            self.canvas.config(width=new_width, height=new_height)
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=self.image_reference)
+    def show_current_image(self):
+        if self.images:
+            self.show_image(self.images[self.current_page])
             self.update_tool_list()
 
+    def show_image(self, path, error_message=None):
+        # Cada petición lleva un número; si el usuario ya ha pasado a otra foto,
+        # el resultado de una decodificación antigua se descarta
+        self.display_token += 1
+        self.displayed_path = path
+        self.pyramid_meta = None
+        self.pending_zoom = None
+        self.zoom = None
+        self.tile_photos.clear()
+        image = self.image_cache.peek(path, height=IMAGE_HEIGHT)
+        if image is not None:
+            self.display_image(image)
+        else:
+            # Con el tamaño del catálogo se reserva el hueco de la foto mientras se decodifica
+            size = self.catalog.display_size(path, IMAGE_HEIGHT)
+            if size:
+                self.canvas.delete("all")
+                self.canvas.config(width=size[0], height=size[1])
+                self.canvas.create_text(size[0] // 2, size[1] // 2, text="Cargando...", font=('calibri', 14))
+            future = self.prefetcher.request(path, IMAGE_HEIGHT)
+            self.root.after(IMAGE_POLL_MS, self.finish_image_load, future, self.display_token, path, error_message)
+        self.prefetch_neighbours()
+
+    def finish_image_load(self, future, token, path, error_message):
+        if token != self.display_token:
+            return
+        if not future.done():
+            self.root.after(IMAGE_POLL_MS, self.finish_image_load, future, token, path, error_message)
+            return
+        try:
+            image = future.result()
+        except (OSError, CancelledError):
+            with instrumentation.phase("espera_usuario"):
+                messagebox.showwarning("Advertencia", error_message or f"No se pudo cargar la imagen '{path}'")
+            return
+        self.display_image(image)
+
+    def prefetch_neighbours(self):
+        if not self.images:
+            return
+        # Se piden primero las más cercanas, alternando hacia delante y hacia atrás
+        paths = [self.images[self.current_page]]
+        for offset in range(1, PREFETCH_RADIUS + 1):
+            for step in (offset, -offset):
+                path = self.images[(self.current_page + step) % len(self.images)]
+                if path not in paths:
+                    paths.append(path)
+        self.prefetcher.prefetch(paths, IMAGE_HEIGHT)
+
+    def display_image(self, image):
+        self.image_reference = ImageTk.PhotoImage(image)
+        self.canvas.delete("all")
+        self.canvas.config(width=image.width, height=image.height)
+        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.image_reference)
+
+    def zoom_image(self, factor, x, y):
+        path = self.displayed_path
+        if path is None:
+            return
+        if self.pyramid_meta is None:
+            # La primera vez se prepara la pirámide en segundo plano; los pasos de rueda de
+            # mientras tanto se acumulan y se aplican al terminar
+            previous = self.pending_zoom[0] if self.pending_zoom else 1.0
+            self.pending_zoom = (previous * factor, x, y)
+            if path not in self.pyramid_futures:
+                self.pyramid_futures[path] = self.run_in_background(
+                    lambda: self.pyramid.ensure(path), lambda future: self.finish_pyramid(future, path))
+            return
+        fit = IMAGE_HEIGHT / self.pyramid_meta["alto"]
+        current = self.zoom or fit
+        zoom = min(current * factor, MAX_ZOOM)
+        if zoom <= fit:
+            self.reset_zoom()
+            return
+        # El punto que está bajo el ratón sigue bajo el ratón
+        origin_x, origin_y = self.zoom_origin if self.zoom else (0.0, 0.0)
+        point_x, point_y = origin_x + x / current, origin_y + y / current
+        self.zoom = zoom
+        self.zoom_origin = (point_x - x / zoom, point_y - y / zoom)
+        self.tile_photos.clear()
+        self.render_tiles()
+
+    def finish_pyramid(self, future, path):
+        del self.pyramid_futures[path]
+        if path != self.displayed_path:
+            return
+        try:
+            self.pyramid_meta = future.result()
+        except OSError as e:
+            messagebox.showwarning("Advertencia", f"No se pudo preparar la ampliación de '{path}': {e}")
+            return
+        if self.pending_zoom:
+            factor, x, y = self.pending_zoom
+            self.pending_zoom = None
+            self.zoom_image(factor, x, y)
+
+    def pan_image(self, event):
+        if self.zoom is None or self.pan_start is None:
+            return
+        dx, dy = event.x - self.pan_start[0], event.y - self.pan_start[1]
+        self.pan_start = (event.x, event.y)
+        self.zoom_origin = (self.zoom_origin[0] - dx / self.zoom, self.zoom_origin[1] - dy / self.zoom)
+        self.render_tiles()
+
+    def reset_zoom(self):
+        if self.zoom is None:
+            return
+        self.zoom = None
+        self.tile_photos.clear()
+        image = self.image_cache.peek(self.displayed_path, height=IMAGE_HEIGHT)
+        if image is not None:
+            self.display_image(image)
+        else:
+            self.show_image(self.displayed_path)
+
+    def render_tiles(self):
+        meta, zoom = self.pyramid_meta, self.zoom
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        origin_x = min(max(0.0, self.zoom_origin[0]), max(0.0, meta["ancho"] - width / zoom))
+        origin_y = min(max(0.0, self.zoom_origin[1]), max(0.0, meta["alto"] - height / zoom))
+        self.zoom_origin = (origin_x, origin_y)
+        # El nivel más reducido que aún tiene al menos la resolución de la pantalla; sus
+        # teselas se encogen (o, pasado el tamaño original, se amplían) por factor
+        level = min(meta["niveles"] - 1, max(0, math.floor(math.log2(1 / zoom))))
+        level_width, level_height = meta["ancho"], meta["alto"]
+        for _ in range(level):
+            level_width, level_height = (level_width + 1) // 2, (level_height + 1) // 2
+        scale = 2 ** -level
+        factor = zoom / scale
+        left, top = origin_x * scale, origin_y * scale
+        columns = range(int(left // TILE_SIZE), min(math.ceil((left + width / factor) / TILE_SIZE), math.ceil(level_width / TILE_SIZE)))
+        rows = range(int(top // TILE_SIZE), min(math.ceil((top + height / factor) / TILE_SIZE), math.ceil(level_height / TILE_SIZE)))
+
+        photos = {}
+        self.canvas.delete("all")
+        for row in rows:
+            for column in columns:
+                key = (level, column, row)
+                photo = self.tile_photos.get(key)
+                if photo is None:
+                    tile_path = self.pyramid.tile_path(self.displayed_path, level, column, row)
+                    image = self.image_cache.peek(tile_path)
+                    if image is None:
+                        # Solo se decodifican las teselas que se ven, en los hilos de precarga
+                        self.tile_futures[tile_path] = self.prefetcher.request(tile_path, None)
+                        continue
+                    if factor != 1:
+                        image = image.resize((math.ceil(image.width * factor), math.ceil(image.height * factor)), Image.BILINEAR)
+                    photo = ImageTk.PhotoImage(image)
+                photos[key] = photo
+                self.canvas.create_image(round((column * TILE_SIZE - left) * factor), round((row * TILE_SIZE - top) * factor),
+                                         anchor=tk.NW, image=photo)
+        # Solo se conservan las teselas visibles
+        self.tile_photos = photos
+        if self.tile_futures and not self.tiles_polling:
+            self.tiles_polling = True
+            self.root.after(IMAGE_POLL_MS, self.poll_tiles, self.display_token)
+
+    def poll_tiles(self, token):
+        self.tiles_polling = False
+        if token != self.display_token or self.zoom is None:
+            self.tile_futures.clear()
+            return
+        finished = [tile_path for tile_path, future in self.tile_futures.items() if future.done()]
+        for tile_path in finished:
+            future = self.tile_futures.pop(tile_path)
+            if not future.cancelled() and future.exception() is not None:
+                # Tesela borrada o dañada: se descarta la pirámide para rehacerla en la próxima
+                # ampliación, que no empieza hasta que se haya terminado de borrar
+                path = self.displayed_path
+                self.pyramid_meta = None
+                self.pyramid_futures[path] = self.run_in_background(
+                    lambda: self.pyramid.discard(path), lambda future: self.pyramid_futures.pop(path, None))
+                self.tile_futures.clear()
+                self.reset_zoom()
+                return
+        if finished:
+            self.render_tiles()
+        elif self.tile_futures:
+            self.tiles_polling = True
+            self.root.after(IMAGE_POLL_MS, self.poll_tiles, token)
+
     def next_image(self):
         if self.images:
             self.current_page = (self.current_page + 1) % len(self.images)
@@ -443,61 +1413,41 @@ class MainApplication:
 
     def update_location_image(self):
         location = self.location_var.get()
-        if location in self.location_images:
-            image_file = self.location_images[location]
-            try:
-                image = Image.open(image_file)
-                
-                # Rotate image based on EXIF data
-                try:
-                    exif = image._getexif()
-                    if exif:
-                        orientation = exif.get(274, 1)  # 274 is the orientation tag
-                        if orientation == 3:
-                            image = image.rotate(180, expand=True)
-                        elif orientation == 6:
-                            image = image.rotate(270, expand=True)
-                        elif orientation == 8:
-                            image = image.rotate(90, expand=True)
-                except (AttributeError, KeyError, IndexError):
-                    # No EXIF data or orientation not found, proceed without rotation
-                    pass
-
-                width, height = image.size
-                new_height = 800  # Reducir la altura máxima de la imagen
-                new_width = int(width * (new_height / height))
-                image = image.resize((new_width, new_height), Image.LANCZOS)
-                self.image_reference = ImageTk.PhotoImage(image)
-                self.canvas.delete("all")
-                self.canvas.config(width=new_width, height=new_height)
-                self.canvas.create_image(0, 0, anchor=tk.NW, image=self.image_reference)
-                if image_file in self.images:
-                    self.current_page = self.images.index(image_file)
-                self.update_tool_list()
-            except FileNotFoundError:
-                messagebox.showwarning("Advertencia", f"No se pudo encontrar la imagen para la ubicación '{location}'")
+        if location in self.inventory.location_images:
+            image_file = self.inventory.location_images[location]
+            index = self.find_image(image_file)
+            if index is not None:
+                self.current_page = index
+            # Al saltar a otra foto, show_image cancela las precargas que ya no son vecinas
+            self.show_image(image_file, f"No se pudo encontrar la imagen para la ubicación '{location}'")
+            self.update_tool_list()
         else:
+            self.display_token += 1
             self.canvas.delete("all")
             self.canvas.create_text(200, 200, text="No hay imagen disponible para esta ubicación", font=('calibri', 14))
             self.update_tool_list()
 
     def update_tool_list(self):
-        self.tool_list.delete(0, tk.END)
         current_image = self.images[self.current_page] if self.images else None
-        for tool in self.inventory:
-            if tool.location in self.location_images and self.location_images[tool.location] == current_image:
-                self.tool_list.insert(tk.END, f"{tool.number}: {tool.name}")
+        with instrumentation.phase("lista"):
+            tools = self.inventory.tools_for_image(current_image)
+            self.tool_list.set_rows([(tool.number, f"{tool.number}: {tool.name}") for tool in tools])
 
     def on_tool_select(self, event):
-        selected = self.tool_list.curselection()
-        if selected:
-            index = selected[0]
-            tool_str = self.tool_list.get(index)
-            tool_number = int(tool_str.split(":")[0])
-            tool = next((t for t in self.inventory if t.number == tool_number), None)
+        tool_number = self.tool_list.selected_number()
+        if tool_number is not None:
+            tool = self.inventory.get(tool_number)
             if tool:
                 self.select_tool(tool)
 
+    def on_close(self):
+        self.prefetcher.shutdown()
+        self.search_executor.shutdown(wait=False, cancel_futures=True)
+        self.background.shutdown(wait=True, cancel_futures=True)
+        self.manager.close()
+        instrumentation.export()
+        self.root.destroy()
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = MainApplication(root)
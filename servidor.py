@@ -0,0 +1,430 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+
+from inventario import STORAGE_MODE, GardenTool, Inventory, InventoryManager, Loan, create_storage
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+# Los cambios que llegan dentro de esta ventana se guardan juntos en una sola escritura
+COALESCE_WINDOW_MS = 20
+RETRY_MS = 1000  # Si no se pudo guardar, cuándo se vuelve a intentar
+REQUEST_TIMEOUT = 10  # Segundos que la ventana espera al servidor antes de dar error
+# "host:puerto" del servidor; si está definida, la ventana trabaja contra él en lugar de los archivos
+SERVER_ADDRESS = os.environ.get("INVENTARIO_SERVIDOR")
+
+class ConflictError(ValueError):
+    # La herramienta cambió en otro puesto desde que se leyó
+    pass
+
+def tool_state(tool, version):
+    data = tool.to_dict()
+    data["versión"] = version
+    return data
+
+class InventoryServer:
+    # Dueño único del inventario. Cada puesto envía una petición JSON por línea y recibe una
+    # respuesta por línea. Cada herramienta lleva una versión (la revisión de su último cambio):
+    # una petición con una versión antigua se rechaza en lugar de pisar el cambio de otro puesto.
+    # Los cambios se aplican en memoria al momento, pero solo se responde cuando están guardados;
+    # todos los que llegan durante la misma ventana se guardan con un único storage.record.
+    def __init__(self, manager, coalesce_ms=COALESCE_WINDOW_MS):
+        self.manager = manager
+        self.manager.pending = []
+        self.manager.pending_loans = []
+        self.coalesce_ms = coalesce_ms
+        # Las revisiones vuelven a empezar en cada arranque; con la época los puestos saben
+        # que su revisión ya no sirve y piden el inventario completo
+        self.epoch = uuid.uuid4().hex
+        self.revision = 0
+        self.versions = {}
+        # Última revisión de cada clave cambiada, en orden de revisión: "cambios" solo recorre
+        # lo nuevo desde el final
+        self.changed = OrderedDict()
+        self.waiters = []
+        self.flush_handle = None
+        self.writable = None
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.writable = asyncio.Event()
+        self.writable.set()
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Servidor del inventario en {host}:{port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    response = await self.dispatch(request)
+                except ConflictError as e:
+                    number = request.get("número")
+                    tool = self.manager.inventory.get(number)
+                    response = {"ok": False, "error": str(e), "conflicto": True,
+                                "herramienta": tool_state(tool, self.versions.get(number, 0)) if tool else None}
+                except (ValueError, KeyError, TypeError, OSError) as e:
+                    response = {"ok": False, "error": str(e)}
+                response["revisión"] = self.revision
+                response["época"] = self.epoch
+                writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        operation = request["op"]
+        if operation == "instantanea":
+            return self.snapshot()
+        if operation == "cambios":
+            return self.changes_since(request["desde"])
+        if operation == "personas":
+            return {"ok": True, "personas": self.manager.borrowers()}
+        if operation == "prestamos_de":
+            loans, history = self.manager.loans_of(request["quien_se_la_lleva"])
+            return {"ok": True, "abiertos": [loan.to_dict() for loan in loans],
+                    "devueltos": [loan.to_dict() for loan in history]}
+        if operation == "atrasados":
+            return {"ok": True, "abiertos": [loan.to_dict() for loan in self.manager.overdue_loans(request["dias"])]}
+        # Entre la espera y el cambio en memoria no hay ningún await: nada se cuela en medio
+        await self.wait_writable()
+        if operation == "nueva_ubicacion":
+            # Ubicaciones e imágenes se guardan aparte del inventario y son raras: se escriben enseguida
+            added = self.manager.add_location(request["ubicación"])
+            if added:
+                self.touch(("ubicaciones", None))
+            return {"ok": True, "añadida": added}
+        if operation == "imagen_ubicacion":
+            self.manager.set_location_image(request["ubicación"], request["imagen"])
+            self.touch(("imagen", request["ubicación"]))
+            return {"ok": True}
+        if operation == "alta":
+            tool = self.manager.add_tool(request["nombre"], request["ubicación"], request.get("número"),
+                                         request.get("quien_se_la_lleva"))
+        else:
+            tool = self.checked_tool(request)
+            if operation == "modificar":
+                self.manager.update_tool(tool, request["nombre"], request["ubicación"])
+            elif operation == "borrar":
+                self.manager.delete_tool(tool)
+            elif operation == "prestar":
+                self.manager.lend_tool(tool, request["quien_se_la_lleva"])
+            elif operation == "devolver":
+                self.manager.return_tool(tool)
+            else:
+                raise ValueError(f"Operación desconocida: {operation}")
+        version = self.touch(("herramienta", tool.number))
+        self.versions[tool.number] = version
+        await self.durable()
+        return {"ok": True, "herramienta": tool_state(tool, version)}
+
+    async def wait_writable(self):
+        while not self.writable.is_set():
+            await self.writable.wait()
+
+    def checked_tool(self, request):
+        number = request["número"]
+        tool = self.manager.inventory.get(number)
+        if tool is None:
+            raise ConflictError(f"La herramienta {number} ya no existe")
+        # Las versiones vuelven a empezar en cada arranque: una de otra época puede coincidir por casualidad
+        if request.get("época") != self.epoch or request.get("versión") != self.versions.get(number, 0):
+            raise ConflictError(f"La herramienta {number} ha cambiado en otro puesto")
+        return tool
+
+    def touch(self, key):
+        self.revision += 1
+        self.changed[key] = self.revision
+        self.changed.move_to_end(key)
+        return self.revision
+
+    def snapshot(self):
+        inventory = self.manager.inventory
+        return {
+            "ok": True,
+            "herramientas": [tool_state(tool, self.versions.get(tool.number, 0)) for tool in inventory],
+            "ubicaciones": self.manager.locations,
+            "imagenes": inventory.location_images,
+        }
+
+    def changes_since(self, revision):
+        inventory = self.manager.inventory
+        tools, deleted, images, locations = [], [], {}, False
+        for (kind, key), changed_at in reversed(self.changed.items()):
+            if changed_at <= revision:
+                break
+            if kind == "herramienta":
+                tool = inventory.get(key)
+                if tool:
+                    tools.append(tool_state(tool, self.versions[key]))
+                else:
+                    deleted.append(key)
+            elif kind == "imagen":
+                images[key] = inventory.location_images.get(key)
+            else:
+                locations = True
+        return {"ok": True, "herramientas": tools, "borradas": deleted, "imagenes": images,
+                "ubicaciones": self.manager.locations if locations else None}
+
+    async def durable(self):
+        # Espera a que el cambio esté en disco; el primero de la ventana programa la escritura
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.schedule_flush(self.coalesce_ms)
+        await future
+
+    def schedule_flush(self, delay_ms):
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(
+                delay_ms / 1000, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        self.flush_handle = None
+        # Varios cambios de la misma herramienta en la ventana se guardan una sola vez
+        changes = list({tool.number: (tool, deleted) for tool, deleted in self.manager.pending}.values())
+        loans, self.manager.pending_loans = self.manager.pending_loans, []
+        self.manager.pending = []
+        waiters, self.waiters = self.waiters, []
+        # Mientras otro hilo guarda no se toca la memoria; las lecturas siguen atendiéndose
+        self.writable.clear()
+        try:
+            if changes:
+                await asyncio.to_thread(self.manager.storage.record, self.manager.inventory, changes)
+                changes = []
+            if loans:
+                await asyncio.to_thread(self.manager.storage.record_loans, loans)
+        except Exception as e:
+            # Los cambios ya están en memoria y los demás puestos pueden verlos: no se descartan,
+            # se vuelven a intentar guardar, y quien los pidió recibe el aviso
+            self.manager.pending[:0] = changes
+            self.manager.pending_loans[:0] = loans
+            self.schedule_flush(RETRY_MS)
+            for future in waiters:
+                future.set_exception(OSError(f"El cambio está hecho pero aún no se ha podido guardar (se reintentará): {e}"))
+        else:
+            for future in waiters:
+                future.set_result(None)
+        finally:
+            self.writable.set()
+
+class RemoteInventoryManager:
+    # Sustituto de InventoryManager para la ventana cuando hay servidor. Mantiene una copia
+    # local del inventario (búsquedas y listas sin ir a la red) que se pone al día con
+    # fetch_changes() + apply_changes(); los cambios se envían al servidor con la versión leída.
+    def __init__(self, address=SERVER_ADDRESS):
+        host, _, port = address.rpartition(":")
+        self.address = (host or SERVER_HOST, int(port))
+        self.inventory = Inventory()
+        self.locations = []
+        self.versions = {}
+        self.revision = 0
+        self.epoch = None
+        self.connection = None
+        self.stream = None
+        self.lock = threading.Lock()
+
+    def request(self, operation, **fields):
+        fields["op"] = operation
+        with self.lock:
+            try:
+                if self.connection is None:
+                    # Sin tiempo límite, un servidor colgado dejaría congelada la ventana
+                    self.connection = socket.create_connection(self.address, timeout=REQUEST_TIMEOUT)
+                    self.connection.settimeout(REQUEST_TIMEOUT)
+                    self.stream = self.connection.makefile("rb")
+                self.connection.sendall(json.dumps(fields, ensure_ascii=False).encode("utf-8") + b"\n")
+                line = self.stream.readline()
+                if not line:
+                    raise ConnectionError("el servidor cerró la conexión")
+            except OSError as e:
+                self.disconnect()
+                raise ValueError(f"No se pudo contactar con el servidor del inventario: {e}") from e
+        response = json.loads(line)
+        if not response["ok"]:
+            if response.get("conflicto"):
+                # Se muestra el estado actual en lugar del que se intentó cambiar; si el servidor
+                # se ha reiniciado, lo hará la próxima sincronización con el inventario completo
+                if response["época"] == self.epoch:
+                    self.apply_tool(fields["número"], response.get("herramienta"))
+                raise ConflictError(response["error"])
+            raise ValueError(response["error"])
+        return response
+
+    def disconnect(self):
+        if self.connection is not None:
+            self.stream.close()
+            self.connection.close()
+            self.connection = self.stream = None
+
+    def load(self):
+        response = self.request("instantanea")
+        inventory = Inventory()
+        versions = {}
+        for data in response["herramientas"]:
+            versions[data["número"]] = data.pop("versión")
+            inventory.add(GardenTool.from_dict(data))
+        for location, image in response["imagenes"].items():
+            inventory.set_location_image(location, image)
+        self.locations = response["ubicaciones"]
+        self.versions = versions
+        self.revision = response["revisión"]
+        self.epoch = response["época"]
+        self.inventory = inventory
+
+    def fetch_changes(self):
+        # Solo red: se puede llamar desde un hilo de fondo
+        changes = self.request("cambios", desde=self.revision)
+        if changes["época"] != self.epoch:
+            # El servidor se ha reiniciado y sus revisiones han vuelto a empezar: se pide todo
+            changes = self.request("instantanea")
+        return changes
+
+    def apply_changes(self, changes):
+        # Desde el hilo de Tk. Devuelve si ha cambiado algo.
+        if changes["época"] != self.epoch:
+            return self.apply_snapshot(changes)
+        # Los cambios se piden en otro hilo: uno hecho desde este puesto mientras tanto ya está
+        # aplicado y es más nuevo que lo que trae la lista
+        for data in changes["herramientas"]:
+            if data["versión"] >= self.versions.get(data["número"], 0):
+                self.apply_tool(data["número"], data)
+        for number in changes["borradas"]:
+            if changes["revisión"] >= self.versions.get(number, 0):
+                self.apply_tool(number, None, changes["revisión"])
+        for location, image in changes["imagenes"].items():
+            self.inventory.set_location_image(location, image)
+        if changes["ubicaciones"] is not None:
+            self.locations = changes["ubicaciones"]
+        self.revision = max(self.revision, changes["revisión"])
+        return bool(changes["herramientas"] or changes["borradas"] or changes["imagenes"]
+                    or changes["ubicaciones"] is not None)
+
+    def apply_snapshot(self, snapshot):
+        # Como load(), pero sobre la copia existente para que la ventana conserve sus herramientas
+        numbers = set()
+        self.versions = {}
+        for data in snapshot["herramientas"]:
+            numbers.add(data["número"])
+            self.apply_tool(data["número"], data)
+        for tool in list(self.inventory):
+            if tool.number not in numbers:
+                self.apply_tool(tool.number, None, snapshot["revisión"])
+        for location, image in snapshot["imagenes"].items():
+            self.inventory.set_location_image(location, image)
+        self.locations = snapshot["ubicaciones"]
+        self.revision = snapshot["revisión"]
+        self.epoch = snapshot["época"]
+        return True
+
+    def apply_tool(self, number, data, deleted_at=0):
+        # Se modifica la herramienta existente para que la ventana pueda seguir usándola. De una
+        # borrada se guarda la revisión del borrado, para no resucitarla con datos anteriores.
+        tool = self.inventory.get(number)
+        if data is None:
+            if tool:
+                self.inventory.remove(tool)
+            self.versions[number] = deleted_at
+            return None
+        if tool:
+            self.inventory.update(tool, data["nombre"], data["ubicación"])
+            tool.borrowed_by = data["quien_se_la_lleva"]
+        else:
+            tool = GardenTool(number, data["nombre"], data["ubicación"], data["quien_se_la_lleva"])
+            self.inventory.add(tool)
+        self.versions[number] = data["versión"]
+        return tool
+
+    def change_tool(self, operation, tool, **fields):
+        response = self.request(operation, número=tool.number, versión=self.versions.get(tool.number, 0),
+                                época=self.epoch, **fields)
+        if operation == "borrar":
+            return self.apply_tool(tool.number, None, response["herramienta"]["versión"])
+        return self.apply_tool(tool.number, response["herramienta"])
+
+    def add_tool(self, name, location, number=None, borrowed_by=None):
+        if not name or not location:
+            raise ValueError("Nombre y ubicación no pueden estar vacíos")
+        response = self.request("alta", nombre=name, ubicación=location, número=number, quien_se_la_lleva=borrowed_by)
+        return self.apply_tool(response["herramienta"]["número"], response["herramienta"])
+
+    def update_tool(self, tool, name, location):
+        if not name or not location:
+            raise ValueError("Nombre y ubicación no pueden estar vacíos")
+        self.change_tool("modificar", tool, nombre=name, ubicación=location)
+
+    def delete_tool(self, tool):
+        self.change_tool("borrar", tool)
+
+    def lend_tool(self, tool, borrower):
+        if not borrower:
+            raise ValueError("Por favor, introduce el nombre de la persona que se lleva la herramienta")
+        self.change_tool("prestar", tool, quien_se_la_lleva=borrower)
+
+    def return_tool(self, tool):
+        self.change_tool("devolver", tool)
+
+    # Las búsquedas se resuelven con la copia local, igual que sin servidor
+    find = InventoryManager.find
+
+    def add_location(self, location):
+        if not location or location in self.locations:
+            return False
+        if self.request("nueva_ubicacion", ubicación=location)["añadida"]:
+            self.locations.append(location)
+            return True
+        return False
+
+    def set_location_image(self, location, image):
+        self.request("imagen_ubicacion", ubicación=location, imagen=image)
+        self.inventory.set_location_image(location, image)
+
+    def borrowers(self):
+        return self.request("personas")["personas"]
+
+    def loans_of(self, borrower):
+        response = self.request("prestamos_de", quien_se_la_lleva=borrower)
+        return ([Loan.from_dict(data) for data in response["abiertos"]],
+                [Loan.from_dict(data) for data in response["devueltos"]])
+
+    def overdue_loans(self, days):
+        return [Loan.from_dict(data) for data in self.request("atrasados", dias=days)["abiertos"]]
+
+    def close(self):
+        with self.lock:
+            self.disconnect()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local del inventario para varios puestos")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--puerto", type=int, default=SERVER_PORT)
+    parser.add_argument("--ventana-ms", type=int, default=COALESCE_WINDOW_MS,
+                        help=f"tiempo durante el que se agrupan cambios en una escritura (por defecto {COALESCE_WINDOW_MS})")
+    parser.add_argument("--almacenamiento", choices=["json", "diario", "sqlite"], default=STORAGE_MODE)
+    args = parser.parse_args(argv)
+
+    manager = InventoryManager(create_storage(args.almacenamiento))
+    manager.load()
+    server = InventoryServer(manager, args.ventana_ms)
+    try:
+        asyncio.run(server.serve(args.host, args.puerto))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Lo que quedara de la última ventana
+        if manager.pending:
+            manager.storage.record(manager.inventory, manager.pending)
+        if manager.pending_loans:
+            manager.storage.record_loans(manager.pending_loans)
+        manager.close()
+
+if __name__ == "__main__":
+    main()